@@ -0,0 +1,73 @@
+"""Microbenchmark for reading ElectrumX responses.
+
+Compares the old send_request loop (decode every recv chunk, str += until
+a newline) with electrum_session.LineBuffer on single-line responses of
+get_history size, fed in recv-sized chunks.
+
+    python bench_electrum.py [megabytes ...]
+"""
+import json
+import sys
+import timeit
+
+from electrum_session import LineBuffer
+
+CHUNK = 4096
+
+
+def make_response(megabytes):
+    history = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        entry = {"tx_hash": "%064x" % (i * 2654435761), "height": 800000 + i, "memo": "dépôt"}
+        history.append(entry)
+        size += len(json.dumps(entry, ensure_ascii=False)) + 2
+        i += 1
+    return (json.dumps({"jsonrpc": "2.0", "id": 1, "result": history}, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def chunks(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+def old_path(parts):
+    response_data = ''
+    for part in parts:
+        chunk = part.decode('utf-8')
+        if not chunk:
+            break
+        response_data += chunk
+        if '\n' in response_data:
+            break
+    return json.loads(response_data.strip())
+
+
+def new_path(parts):
+    buffer = LineBuffer()
+    for part in parts:
+        lines = buffer.feed(part)
+        if lines:
+            return json.loads(lines[0])
+
+
+def main(sizes):
+    for megabytes in sizes:
+        data = make_response(megabytes)
+        parts = chunks(data, CHUNK)
+        try:
+            old_path(parts)
+            split = "ok"
+        except UnicodeDecodeError:
+            split = "breaks on split UTF-8"
+        ascii_parts = chunks(data.decode('utf-8').encode('ascii', 'replace'), CHUNK)
+        assert old_path(ascii_parts) == new_path(ascii_parts)
+        number = max(1, int(20 / megabytes))
+        old = min(timeit.repeat(lambda: old_path(ascii_parts), number=number, repeat=5)) / number
+        new = min(timeit.repeat(lambda: new_path(ascii_parts), number=number, repeat=5)) / number
+        print("%5.1f MB in %i chunks  old %8.2f ms (%s)  new %8.2f ms  %5.1fx" % (
+            len(data) / 1024 / 1024, len(parts), old * 1000, split, new * 1000, old / new))
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [0.1, 1, 8])
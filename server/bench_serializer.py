@@ -0,0 +1,63 @@
+"""Microbenchmark for the JSON response path.
+
+Compares the old `.dict(by_alias=True)` + json.dumps(cls=DateTimeEncoder)
+encoding with serializer.jsonable/dumps on get_user_transactions-sized
+payloads.
+
+    python bench_serializer.py [rows ...]
+"""
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from models import Transaction
+from serializer import dumps, jsonable, orjson
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def make_transactions(rows):
+    now = datetime.now()
+    return [
+        Transaction(
+            user_id="user%i@example.com" % (i % 7),
+            coin=("BTC", "ETH", "USDT", "SOL")[i % 4],
+            side=("buy", "sell", "deposit", "withdraw")[i % 4],
+            amount=0.00012345 * (i + 1),
+            price=1234567.89 + i,
+            txhash="%064x" % (i * 2654435761),
+            txtype="user",
+            status="completed",
+            created_at=now - timedelta(minutes=i),
+        )
+        for i in range(rows)
+    ]
+
+
+def old_path(transactions):
+    return json.dumps({"data": [t.dict(by_alias=True) for t in transactions]}, cls=DateTimeEncoder).encode('utf-8')
+
+
+def new_path(transactions):
+    return dumps({"data": jsonable(transactions)})
+
+
+def main(sizes):
+    print("encoder: %s" % ("orjson" if orjson is not None else "json"))
+    for rows in sizes:
+        transactions = make_transactions(rows)
+        assert json.loads(old_path(transactions)) == json.loads(new_path(transactions))
+        number = max(1, 20000 // rows)
+        old = min(timeit.repeat(lambda: old_path(transactions), number=number, repeat=5)) / number
+        new = min(timeit.repeat(lambda: new_path(transactions), number=number, repeat=5)) / number
+        print("%6i rows  old %8.3f ms  new %8.3f ms  %5.1fx" % (rows, old * 1000, new * 1000, old / new))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
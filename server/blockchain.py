@@ -32,13 +32,29 @@ from bit.network import NetworkAPI
 import binascii
 
 import json
-import socket
-import ssl
 import bit
 
 from models import GeneratedWallet, NewWallet, FullWallet
+import evm_rpc
+import json_rpc
+from evm_follower import EvmBlockFollower, DEFAULT_CONFIRMATIONS
+from electrum_session import ElectrumSession
+from tx_cache import tx_cache, MISSING
+from sol_watcher import SolanaWatcher, ws_url as sol_ws_url
+from tron_follower import TronBlockFollower, http_post as tron_http_post
 from config import COIN_SETTINGS, POLL_INTERVAL,PRKEY,ETHAPIKEY,BSCAPIKEY,TRONAPIKEY,VALRDEPOSIT, COIN_NETWORKS, DATABASE_TYPE, COIN_CONTRACTS
 
+# page sizes of the incremental history readers
+ETHERSCAN_PAGE = 1000
+TRONSCAN_PAGE = 50
+TRONGRID_PAGE = 200
+SOL_SIGNATURES_PAGE = 1000
+SOL_TRANSACTIONS_BATCH = 100
+SOL_ACCOUNTS_BATCH = 100
+
+# EVM chains followed block by block, and the token network read from their logs
+FOLLOWED_CHAINS = {'ETH': 'ERC20', 'BNB': None, 'TRX': 'TRC20'}
+
 # ERC20 Token ABI (Standard Interface)
 ERC20_ABI = [
     {
@@ -119,95 +135,6 @@ def address_to_scripthash(address):
         raise Exception(f"Error converting address to scripthash: {e}")
 
 
-# Basic synchronous JSON-RPC client for ElectrumX
-class ElectrumXClient:
-    #electrum.blockstream.info 50001 electrum.cakewallet.com 50001 2ex.digitaleveryware.com 50001
-
-    def __init__(self, host, port, ssl=True):
-        self.host = host
-        self.port = port
-        self.ssl = ssl
-        self.socket = None
-        self.id_counter = 0
-
-    def connect(self):
-        try:
-            # Create socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            if self.ssl:
-                # Wrap socket with SSL
-                context = ssl.create_default_context()
-                self.socket = context.wrap_socket(self.socket, server_hostname=self.host)
-            self.socket.connect((self.host, self.port))
-        except Exception as e:
-            raise Exception(f"Connection error: {e}")
-
-    def close(self):
-        if self.socket:
-            self.socket.close()
-            self.socket = None
-
-    def send_request(self, method, params):
-        self.id_counter += 1
-        request = {
-            "jsonrpc": "2.0",
-            "id": self.id_counter,
-            "method": method,
-            "params": params
-        }
-        # Serialize and send request
-        request_data = json.dumps(request) + '\n'
-        self.socket.sendall(request_data.encode('utf-8'))
-
-        # Receive response
-        response_data = ''
-        while True:
-            chunk = self.socket.recv(4096).decode('utf-8')
-            if not chunk:
-                break
-            response_data += chunk
-            if '\n' in response_data:
-                break
-
-        try:
-            response = json.loads(response_data.strip())
-            
-#            print(response)
-            return response
-#            print("!!!!!!!!!!")
-#            if "error" in response and response["error"] is not None:
-#              print(f"RPC Error: ")
-              #print(f"RPC Error: {response['error']}")
-              #raise Exception(f"RPC Error: {response['error']}")
-#              return {}
-
-#            else:
-#              return response["result"]
-        except json.JSONDecodeError:
-            raise Exception("Invalid JSON response from server")
-
-    def get_history(self, scripthash):
-        return self.send_request("blockchain.scripthash.get_history", [scripthash])
-
-    def get_balance(self, scripthash):
-        return self.send_request("blockchain.scripthash.get_balance", [scripthash])
-
-    def get_transaction(self, txid):
-        transaction = self.send_request("blockchain.transaction.get", [txid, False])
-        return deserialize(transaction['result'])
-
-    def list_unspent(self, scripthash):
-        return self.send_request("blockchain.scripthash.listunspent", [scripthash])
-
-    def broadcast(self, raw_hex):
-        return self.send_request("blockchain.transaction.broadcast", [raw_hex])
-
-    def get_fee(self):
-        return self.send_request("blockchain.relayfee", [])
-
-    def get_fee_num(self,blocks):
-        return self.send_request("blockchain.estimatefee", [blocks])
-
 class Blockchain:
     def __init__(self):
         self.coins = COIN_SETTINGS
@@ -218,7 +145,44 @@ class Blockchain:
         provider = HTTPProvider(timeout=30, endpoint_uri=COIN_SETTINGS['TRX']['rpc_url'])
         provider.sess.trust_env = False
         self.trx_client = Tron(provider)
-
+        self.rpc_sessions = {}
+        self.electrum = None
+        self.watched_scripthashes = {}
+        self.sol_watcher = None
+        self.on_activity = None
+
+
+    def electrum_session(self):
+        if self.electrum is None:
+          settings = COIN_SETTINGS['BTC']['electrum']
+          self.electrum = ElectrumSession(settings['host'], settings['port'], ssl=settings['ssl'], on_status=self.on_electrum_status)
+        return self.electrum
+
+    def on_electrum_status(self, scripthash, status):
+        address = self.watched_scripthashes.get(scripthash)
+        if address and self.on_activity:
+          self.on_activity('BTC', address)
+
+    def watch_addresses(self, coin, addresses, callback):
+        """Subscribe to pushed activity; returns the addresses callback(coin, address) will be called for"""
+        self.on_activity = callback
+        if coin == 'SOL':
+          if self.sol_watcher is None:
+            url = COIN_SETTINGS['SOL'].get('ws_url') or sol_ws_url(COIN_SETTINGS['SOL']['rpc_url'])
+            self.sol_watcher = SolanaWatcher(url, lambda address: self.on_activity and self.on_activity('SOL', address))
+          return self.sol_watcher.watch(addresses)
+        if coin != 'BTC':
+          return set()
+        scripthashes = {}
+        for address in addresses:
+          try:
+            scripthashes[address_to_scripthash(address)] = address
+          except Exception:
+            # bech32 addresses are not supported by address_to_scripthash and stay polled
+            continue
+        self.watched_scripthashes.update(scripthashes)
+        self.electrum_session().subscribe(scripthashes)
+        return set(scripthashes.values())
 
     def get_btc_fee(self):
         url="https://mempool.space/api/v1/fees/recommended"
@@ -228,8 +192,12 @@ class Blockchain:
 
 
       
-    def get_balance(self, wallet: FullWallet):
+    def get_balance(self, wallet: FullWallet, known=None):
+        """known: balances already read in bulk (get_balances), keyed by coin or token network"""
         coin = wallet.coin
+        known = known or {}
+        if coin in known:
+          return str(known[coin])
         if coin in self.coins:
           if coin == "BTC":
             balance = self.get_elbtc_balance(wallet.address)
@@ -251,7 +219,10 @@ class Blockchain:
             for netcoin in COIN_NETWORKS[coin]:
               basecoin = coin + netcoin
               #print(basecoin)
-              balance += self.get_token_balance(netcoin, coin, wallet)
+              if netcoin in known:
+                balance += known[netcoin]
+              else:
+                balance += self.get_token_balance(netcoin, coin, wallet)
             return str(balance)
           else:
             return '0'
@@ -358,6 +329,155 @@ class Blockchain:
         else:
           return []
 
+    def get_new_transactions(self, wallet: FullWallet, cursor=None):
+        """Transactions after the wallet's sync cursor; returns (transactions, cursor)
+
+        The cursor is a dict keyed by coin or token network: the last
+        block for Etherscan, the last timestamp (ms) for Tron and the newest
+        signature for Solana. An empty cursor reads the whole history. BTC
+        history from ElectrumX is always complete and cached per
+        transaction, so it keeps no cursor.
+        """
+        coin = wallet.coin
+        cursor = dict(cursor or {})
+        if coin == "ETH":
+          transactions, cursor['ETH'] = self.get_etherscan_transactions(1, ETHAPIKEY, 'txlist', wallet.address, cursor.get('ETH'))
+        elif coin == "BNB":
+          transactions, cursor['BNB'] = self.get_etherscan_transactions(56, BSCAPIKEY, 'txlist', wallet.address, cursor.get('BNB'))
+        elif coin == "TRX":
+          transactions, cursor['TRX'] = self.get_tron_transactions_since(wallet.address, cursor.get('TRX'))
+        elif coin == "SOL":
+          transactions, cursor['SOL'] = self.get_sol_transactions_since(wallet.address, cursor.get('SOL'))
+        elif coin in COIN_NETWORKS:
+          if DATABASE_TYPE == 'postgresql':
+              from postgres_storage import storage
+          elif DATABASE_TYPE == 'mysql':
+              from storage import storage
+          transactions = []
+          user = storage.get_user_by_email(wallet.email)
+          for netcoin in COIN_NETWORKS[coin]:
+            networkwallet = storage.get_coinwallet(netcoin, user)
+            if netcoin == "TRC20":
+              found, cursor[netcoin] = self.get_trc20_transactions_since(networkwallet.address, COIN_CONTRACTS[coin][netcoin], cursor.get(netcoin))
+              transactions += found
+            elif netcoin == "ERC20":
+              found, cursor[netcoin] = self.get_etherscan_transactions(1, ETHAPIKEY, 'tokentx', networkwallet.address, cursor.get(netcoin), COIN_CONTRACTS[coin][netcoin])
+              transactions += found
+        else:
+          return self.get_transactions(wallet), cursor
+        return transactions, {key: value for key, value in cursor.items() if value is not None}
+
+    def get_etherscan_transactions(self, chainid, apikey, action, address, startblock=None, contract=None):
+        """txlist/tokentx from startblock (inclusive) on, oldest first, paging until caught up
+
+        Returns (transactions, last block read).
+        """
+        transactions = {}
+        block = startblock or 0
+        last = startblock
+        page = 1
+        while True:
+          url = f"https://api.etherscan.io/v2/api?chainid={chainid}&module=account&action={action}&address={address}&startblock={block}&endblock=99999999&page={page}&offset={ETHERSCAN_PAGE}&sort=asc&apikey={apikey}"
+          if contract:
+            url += f"&contractaddress={contract}"
+          response = requests.get(url)
+          if response.status_code != 200:
+            break
+          data = response.json()
+          # "No transactions found" comes back with status 0 as well
+          if data.get("status") != "1":
+            break
+          result = data.get("result", [])
+          for tx in result:
+            if action == 'tokentx':
+              side = 'Sent to' if tx['from'].lower() == address.lower() else 'Deposit'
+            else:
+              side = "Deposit" if tx["to"].lower() == address.lower() else "Sent to"
+            transactions[tx["hash"]] = {
+                "hash": tx["hash"],
+                "side": side,
+                "amount": int(tx["value"])
+            }
+            last = int(tx["blockNumber"])
+          if len(result) < ETHERSCAN_PAGE:
+            break
+          if last == block:
+            # one block fills the page, page through it
+            page += 1
+          else:
+            # the last block may continue on the next page, read it again
+            block = last
+            page = 1
+        return list(transactions.values()), last
+
+    def get_tron_transactions_since(self, address, since=None):
+        """Tronscan transactions at or after `since` (ms), newest first, paging until caught up
+
+        Returns (transactions, newest timestamp); the cursor only moves once
+        every page was read.
+        """
+        headers = {"Content-Type": "application/json"}
+        transactions = []
+        newest = since
+        start = 0
+        while True:
+          url = f"https://api.tronscan.org/api/transaction?sort=-timestamp&limit={TRONSCAN_PAGE}&start={start}&address={address}"
+          if since:
+            url += f"&start_timestamp={since}"
+          response = requests.get(url, headers=headers)
+          if response.status_code != 200:
+            return transactions, since
+          page = response.json().get("data", [])
+          for tx in page:
+            side = "Deposit" if tx["toAddress"] == address else "Sent to"
+            transactions.append({
+                "hash": tx["hash"],
+                "side": side,
+                "amount": int(tx["amount"])
+            })
+            newest = max(newest or 0, int(tx["timestamp"]))
+          if len(page) < TRONSCAN_PAGE:
+            break
+          start += len(page)
+        return transactions, newest
+
+    def get_trc20_transactions_since(self, address, token_contract, since=None):
+        """TronGrid TRC20 transfers at or after `since` (ms), oldest first, paging until caught up
+
+        Returns (transactions, last timestamp read).
+        """
+        url = f"https://api.trongrid.io/v1/accounts/{address}/transactions/trc20"
+        params = {
+            'limit': TRONGRID_PAGE,
+            'contract_address': token_contract,
+            'order_by': 'block_timestamp,asc',
+        }
+        if since:
+          params['min_timestamp'] = since
+        headers = {'TRON-PRO-API-KEY': TRONAPIKEY} if TRONAPIKEY else {}
+        transactions = []
+        last = since
+        try:
+          while True:
+            data = requests.get(url, params=params, headers=headers).json()
+            if not data.get('success'):
+              break
+            for tx in data.get('data', []):
+              side = 'Sent to' if tx.get('from', '').lower() == address.lower() else 'Deposit'
+              transactions.append({
+                  'hash': tx.get('transaction_id'),
+                  'side': side,
+                  'amount': tx.get('value')
+              })
+              last = max(last or 0, int(tx.get('block_timestamp', 0)))
+            fingerprint = data.get('meta', {}).get('fingerprint')
+            if not fingerprint:
+              break
+            params['fingerprint'] = fingerprint
+        except Exception as e:
+          print(f"Error getting TRC20 transactions: {e}")
+        return transactions, last
+
     def forward_to_hot(self, wallet: FullWallet):
         coin = wallet.coin
         try:
@@ -517,43 +637,40 @@ class Blockchain:
             scriptpubkeyaddress = address_to_scriptpubkey(address)
             #print(scripthash)
             
-            # Connect to ElectrumX server
-            client = ElectrumXClient(COIN_SETTINGS['BTC']['electrum']['host'], COIN_SETTINGS['BTC']['electrum']['port'], ssl=COIN_SETTINGS['BTC']['electrum']['ssl'])
-            client.connect()
-            
-            # Get transaction history
-            history_response = client.get_history(scripthash)
-            #print(history_response)
-            
-            transactions = []
-            if history_response and 'result' in history_response:
-                for tx in history_response['result']:
-                    # Get full transaction details
-                    tx_response = client.get_transaction(tx['tx_hash'])
-                    #print(tx['tx_hash'])
-
-                    if tx_response:
-                        # Determine if deposit or withdrawal
-                        side = 'Sent to'
-                        amount = 0
-                        #print(tx_response.TxOut)
-
-                        for vout in tx_response.TxOut:
-                            addresses = vout.script_pubkey
-                            if scriptpubkeyaddress in addresses:
-                                side = 'Deposit'
-                                amount = int.from_bytes(vout.amount, byteorder='little')
-                                #amount = int(vout.amount * 100000000)  # Convert BTC to satoshis
-                                break
-                        if side:
-                          transactions.append({
-                              'hash': tx['tx_hash'],
-                              'side': side,
-                              'amount': amount,
-                          })
-            
-            client.close()
-            return transactions
+            session = self.electrum_session()
+            history = session.request("blockchain.scripthash.get_history", [scripthash])
+            decoded = {tx['tx_hash']: tx_cache.get_decoded('BTC', tx['tx_hash'], address) for tx in history}
+            new = [tx for tx in history if decoded[tx['tx_hash']] is MISSING]
+            raw_transactions = tx_cache.get_raw_many('BTC', [tx['tx_hash'] for tx in new])
+            # every raw transaction we do not have yet in one batch
+            fetch = [tx['tx_hash'] for tx in new if tx['tx_hash'] not in raw_transactions]
+            for txid, raw in zip(fetch, session.batched("blockchain.transaction.get", ([txid, False] for txid in fetch))):
+                if isinstance(raw, Exception):
+                    raise raw
+                raw_transactions[txid] = bytes.fromhex(raw)
+
+            for tx in new:
+                txid = tx['tx_hash']
+                tx_response = deserialize(raw_transactions[txid].hex())
+                # Determine if deposit or withdrawal
+                side = 'Sent to'
+                amount = 0
+                for vout in tx_response.TxOut:
+                    addresses = vout.script_pubkey
+                    if scriptpubkeyaddress in addresses:
+                        side = 'Deposit'
+                        amount = int.from_bytes(vout.amount, byteorder='little')
+                        break
+                decoded[txid] = {
+                    'hash': txid,
+                    'side': side,
+                    'amount': amount,
+                }
+                # mempool transactions (height <= 0) may still change
+                if tx.get('height', 0) > 0:
+                    tx_cache.put_raw('BTC', txid, raw_transactions[txid])
+                    tx_cache.put_decoded('BTC', txid, address, decoded[txid])
+            return [decoded[tx['tx_hash']] for tx in history]
         except Exception as e:
             print(f"ElectrumX error, falling back to API: {e}")
             # Fallback to blockstream API
@@ -636,85 +753,115 @@ class Blockchain:
       
     def get_sol_transactions(self, address):
         try:
-            # Get transaction signatures for the address
-            pubkey = Pubkey.from_string(address)
-            
-            # Fetch signatures (limit to 50 most recent)
-            response = self.sol_client.get_signatures_for_address(
-                pubkey,
-                limit=50
-            )
-            
-            transactions = []
-            #print(response)
-            
-            if response and hasattr(response, 'value') and response.value:
-                for sig_info in response.value:
-                    # Get transaction details
-                    tx_hash = str(sig_info.signature)
-                    print(tx_hash)
-                    
-                    # Fetch full transaction to determine side and amount
-                    try:
-                        tx_response = self.sol_client.get_transaction(
-                            sig_info.signature,
-                            encoding="jsonParsed",
-                            max_supported_transaction_version=0
-                        )
-                        
-                        if tx_response and hasattr(tx_response, 'value') and tx_response.value:
-                            tx_data = tx_response.value
-                            
-                            # Parse transaction to find transfers involving this address
-                            if hasattr(tx_data, 'transaction') and hasattr(tx_data.transaction.transaction, 'message'):
-                                message = tx_data.transaction.transaction.message
-                                
-                                
-                                # Default values
-                                side = "Unknown"
-                                amount = 0
-                                
-                                # Check if this is a simple transfer
-                                if hasattr(message, 'instructions'):
-                                    for instruction in message.instructions:
-                                        
-                                        # Check for system program transfers (native SOL)
-                                        if hasattr(instruction, 'parsed'):
-                                            parsed = instruction.parsed
-                                            
-                                            if isinstance(parsed, dict):
-                                                if parsed.get('type') == 'transfer':
-                                                    info = parsed.get('info', {})
-                                                    
-                                                    destination = info.get('destination')
-                                                    source = info.get('source')
-                                                    lamports = info.get('lamports', 0)
-                                                    
-                                                    # Determine if deposit or withdrawal
-                                                    if destination == address:
-                                                        side = "Deposit"
-                                                        amount = lamports
-                                                    elif source == address:
-                                                        side = "Sent to"
-                                                        amount = lamports
-                                
-                                # Add transaction if we identified it
-                                if side != "Unknown" and amount > 0:
-                                    transactions.append({
-                                        'hash': tx_hash,
-                                        'side': side,
-                                        'amount': amount,  # in lamports (1 SOL = 1,000,000,000 lamports)
-                                    })
-                    except Exception as e:
-                        # Skip transactions we can't parse
-                        print(f"Error parsing SOL transaction {tx_hash}: {e}")
-                        continue
-            #print(transactions)
+            # 50 most recent signatures
+            transactions, _ = self.get_sol_parsed(address, self.get_sol_signatures(address, limit=50))
             return transactions
-            
         except Exception as e:
             print(f"Error fetching Solana transactions: {e}")
             return []
+
+    def get_sol_signatures(self, address, until=None, before=None, limit=SOL_SIGNATURES_PAGE):
+        options = {"limit": limit}
+        if until:
+            options["until"] = until
+        if before:
+            options["before"] = before
+        return self.sol_rpc("getSignaturesForAddress", [address, options]) or []
+
+    def sol_rpc(self, method, params):
+        (result,) = json_rpc.rpc_batch(self.rpc_transport('SOL'), [(method, params)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_sol_transactions_since(self, address, until=None):
+        """Transactions newer than the `until` signature, paging back until caught up
+
+        Returns (transactions, cursor). The cursor only moves once every
+        page was read, and never past a transaction that could not be
+        fetched: it stops at the signature just older than the oldest one.
+        """
+        signatures = []
+        try:
+            before = None
+            while True:
+                page = self.get_sol_signatures(address, until=until, before=before)
+                signatures += page
+                if len(page) < SOL_SIGNATURES_PAGE:
+                    break
+                before = page[-1]['signature']
+            transactions, failed = self.get_sol_parsed(address, signatures)
+        except Exception as e:
+            print(f"Error fetching Solana transactions: {e}")
+            return [], until
+        if not signatures:
+          return transactions, until
+        if failed:
+          oldest = max(index for index, sig_info in enumerate(signatures) if sig_info['signature'] in failed)
+          return transactions, signatures[oldest + 1]['signature'] if oldest + 1 < len(signatures) else until
+        return transactions, signatures[0]['signature']
+
+    def get_sol_parsed(self, address, signatures):
+        """({hash, side, amount} of the transfers to or from address, signatures that failed)
+
+        Transactions not in tx_cache are fetched in batched getTransaction
+        calls; finalized ones are cached, including those that are not
+        transfers of ours.
+        """
+        results = {}
+        fetch = []
+        failed = set()
+        for sig_info in signatures:
+            cached = tx_cache.get_decoded('SOL', sig_info['signature'], address)
+            if cached is MISSING:
+                fetch.append(sig_info)
+            else:
+                results[sig_info['signature']] = cached
+        options = {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}
+        for offset in range(0, len(fetch), SOL_TRANSACTIONS_BATCH):
+            chunk = fetch[offset:offset + SOL_TRANSACTIONS_BATCH]
+            replies = json_rpc.rpc_batch(self.rpc_transport('SOL'), [("getTransaction", [sig_info['signature'], options]) for sig_info in chunk])
+            for sig_info, tx_data in zip(chunk, replies):
+                tx_hash = sig_info['signature']
+                if isinstance(tx_data, Exception) or not tx_data:
+                    # the caller keeps its cursor below it so it is read again
+                    print(f"Error parsing SOL transaction {tx_hash}: {tx_data}")
+                    failed.add(tx_hash)
+                    continue
+                results[tx_hash] = self.parse_sol_transfer(address, tx_hash, tx_data)
+                if sig_info.get('confirmationStatus') == 'finalized':
+                    tx_cache.put_decoded('SOL', tx_hash, address, results[tx_hash])
+        transactions = []
+        for sig_info in signatures:
+            result = results.get(sig_info['signature'])
+            if result:
+                transactions.append(result)
+        return transactions, failed
+
+    def parse_sol_transfer(self, address, tx_hash, tx_data):
+        # Default values
+        side = "Unknown"
+        amount = 0
+        message = tx_data.get('transaction', {}).get('message', {})
+        # Check for system program transfers (native SOL)
+        for instruction in message.get('instructions', []):
+            parsed = instruction.get('parsed')
+            if isinstance(parsed, dict) and parsed.get('type') == 'transfer':
+                info = parsed.get('info', {})
+                # Determine if deposit or withdrawal
+                if info.get('destination') == address:
+                    side = "Deposit"
+                    amount = info.get('lamports', 0)
+                elif info.get('source') == address:
+                    side = "Sent to"
+                    amount = info.get('lamports', 0)
+        if side != "Unknown" and amount > 0:
+            return {
+                'hash': tx_hash,
+                'side': side,
+                'amount': amount,  # in lamports (1 SOL = 1,000,000,000 lamports)
+            }
+        return None
             
     def get_btc_balance(self, address):
         url = f"{COIN_SETTINGS['BTC']['rpc_url']}/addrs/{address}/balance"
@@ -739,26 +886,9 @@ class Blockchain:
             # Convert address to scripthash
             scripthash = address_to_scripthash(address)
             
-            # Connect to ElectrumX server
-            client = ElectrumXClient(COIN_SETTINGS['BTC']['electrum']['host'], COIN_SETTINGS['BTC']['electrum']['port'], ssl=COIN_SETTINGS['BTC']['electrum']['ssl'])
-            client.connect()
-            
-            # Get balance
-            balance_response = client.get_balance(scripthash)
-            
-#            print(client.get_fee())
-#            print(client.get_fee_num(1))
-#            print(client.get_fee_num(3))
-            client.close()
-            
-            if balance_response and 'result' in balance_response:
-                # ElectrumX returns confirmed and unconfirmed balances in satoshis
-                confirmed = balance_response['result'].get('confirmed', 0)
-                unconfirmed = balance_response['result'].get('unconfirmed', 0)
-                total_balance = confirmed + unconfirmed
-                return total_balance
-            
-            return 0
+            balance = self.electrum_session().request("blockchain.scripthash.get_balance", [scripthash])
+            # ElectrumX returns confirmed and unconfirmed balances in satoshis
+            return balance.get('confirmed', 0) + balance.get('unconfirmed', 0)
         except Exception as e:
             print(f"ElectrumX error, falling back to API: {e}")
             # Fallback to existing API method
@@ -798,6 +928,103 @@ class Blockchain:
     def get_bnb_balance(self, address):
         return self.bnb_client.eth.get_balance(address)
 
+    def rpc_transport(self, coin):
+        if coin not in self.rpc_sessions:
+          self.rpc_sessions[coin] = json_rpc.http_transport(requests.Session(), COIN_SETTINGS[coin]['rpc_url'])
+        return self.rpc_sessions[coin]
+
+    def get_evm_balances(self, coin, addresses):
+        """Native ETH/BNB balances of many addresses in batched eth_getBalance calls
+
+        Returns (balances, errors) keyed by address.
+        """
+        batch_size = COIN_SETTINGS[coin].get('rpc_batch_size', evm_rpc.DEFAULT_BATCH_SIZE)
+        return evm_rpc.get_balances(self.rpc_transport(coin), addresses, batch_size)
+
+    def get_erc20_balances(self, pairs):
+        """balanceOf for many (token_contract, holder) pairs through Multicall3
+
+        Returns (balances, errors) keyed by pair.
+        """
+        settings = COIN_SETTINGS['ETH']
+        return evm_rpc.get_token_balances(
+            self.rpc_transport('ETH'), pairs,
+            multicall=settings.get('multicall_address', evm_rpc.MULTICALL3),
+            batch_size=settings.get('multicall_batch_size', evm_rpc.MULTICALL_BATCH_SIZE))
+
+    def block_follower(self, coin, storage):
+        network = FOLLOWED_CHAINS[coin]
+        tokens = {}
+        if network:
+          tokens = {COIN_CONTRACTS[token][network]: token for token in COIN_NETWORKS if network in COIN_NETWORKS[token]}
+        if coin == 'TRX':
+          headers = {'TRON-PRO-API-KEY': TRONAPIKEY} if TRONAPIKEY else None
+          return TronBlockFollower(
+              coin, tron_http_post(requests.Session(), COIN_SETTINGS[coin]['rpc_url'], headers),
+              lambda: storage.get_chain_cursor(coin),
+              lambda block, blockhash: storage.set_chain_cursor(coin, block, blockhash),
+              network=network, tokens=tokens)
+        return EvmBlockFollower(
+            coin, self.rpc_transport(coin),
+            lambda: storage.get_chain_cursor(coin),
+            lambda block, blockhash: storage.set_chain_cursor(coin, block, blockhash),
+            network=network, tokens=tokens,
+            confirmations=COIN_SETTINGS[coin].get('confirmations', DEFAULT_CONFIRMATIONS))
+
+    def get_balances(self, coin, wallets):
+        """Bulk balance reads for the deposit scanner
+
+        Returns {wallet.address: known} to pass to get_balance: native BTC,
+        ETH, BNB and SOL balances and the ERC20 part of token balances. Wallets or networks
+        missing from it are read one by one as before.
+        """
+        known = {}
+        if coin == 'SOL':
+          addresses = [wallet.address for wallet in wallets]
+          chunks = [addresses[offset:offset + SOL_ACCOUNTS_BATCH] for offset in range(0, len(addresses), SOL_ACCOUNTS_BATCH)]
+          replies = json_rpc.rpc_batch(self.rpc_transport('SOL'), [("getMultipleAccounts", [chunk, {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}]) for chunk in chunks])
+          for chunk, reply in zip(chunks, replies):
+            if isinstance(reply, Exception):
+              print("SOL batch balance error: %s" % reply)
+              continue
+            for address, account in zip(chunk, reply.get('value', [])):
+              # accounts that were never funded do not exist
+              known[address] = {coin: account['lamports'] if account else 0}
+        elif coin == 'BTC':
+          scripthashes = {}
+          for wallet in wallets:
+            try:
+              scripthashes[wallet.address] = address_to_scripthash(wallet.address)
+            except Exception:
+              continue
+          results = self.electrum_session().batched("blockchain.scripthash.get_balance", ([scripthash] for scripthash in scripthashes.values()))
+          for address, balance in zip(scripthashes, results):
+            if not isinstance(balance, Exception):
+              known[address] = {coin: balance.get('confirmed', 0) + balance.get('unconfirmed', 0)}
+        elif coin in ('ETH', 'BNB'):
+          balances, errors = self.get_evm_balances(coin, [wallet.address for wallet in wallets])
+          if errors:
+            print("%s batch balance: %i of %i addresses failed" % (coin, len(errors), len(wallets)))
+          for wallet in wallets:
+            if wallet.address in balances:
+              known[wallet.address] = {coin: balances[wallet.address]}
+        elif coin in COIN_NETWORKS and 'ERC20' in COIN_NETWORKS[coin]:
+          if DATABASE_TYPE == 'postgresql':
+              from postgres_storage import storage
+          elif DATABASE_TYPE == 'mysql':
+              from storage import storage
+          holders = storage.get_network_addresses('ERC20')
+          contract = COIN_CONTRACTS[coin]['ERC20']
+          pairs = [(contract, holders[wallet.email]) for wallet in wallets if wallet.email in holders]
+          balances, errors = self.get_erc20_balances(pairs)
+          if errors:
+            print("%s ERC20 batch balance: %i of %i holders failed" % (coin, len(errors), len(pairs)))
+          for wallet in wallets:
+            pair = (contract, holders.get(wallet.email))
+            if pair in balances:
+              known[wallet.address] = {'ERC20': balances[pair]}
+        return known
+
     def get_sol_balance(self, address):
         pubkey = Pubkey.from_string(address)
         response = self.sol_client.get_balance(pubkey)
@@ -818,10 +1045,8 @@ class Blockchain:
         key = Key.from_hex(priv_key_hex)
         balance = self.get_elbtc_balance(address)
         if balance > COIN_SETTINGS['BTC']['min_send_amount']:
-            client = ElectrumXClient(COIN_SETTINGS['BTC']['electrum']['host'], COIN_SETTINGS['BTC']['electrum']['port'], ssl=COIN_SETTINGS['BTC']['electrum']['ssl'])
-            client.connect()
-        
-            fee_rate = int(math.ceil((float(client.get_fee_num(1)['result'])/1000)*10**8))
+            session = self.electrum_session()
+            fee_rate = int(math.ceil((float(session.request("blockchain.estimatefee", [1]))/1000)*10**8))
             print(fee_rate)
             signed_raw_tx = key.create_transaction(
                 outputs=[],
@@ -830,8 +1055,7 @@ class Blockchain:
             )
             
             print(signed_raw_tx)
-            client.broadcast(signed_raw_tx)
-            client.close()
+            session.request("blockchain.transaction.broadcast", [signed_raw_tx])
 
             txid = NetworkAPI.broadcast_tx(signed_raw_tx)
         
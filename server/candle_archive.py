@@ -0,0 +1,96 @@
+import os
+import threading
+
+import numpy as np
+
+from market_series import CANDLE_DTYPE
+
+CANDLE_ARCHIVE_DIR = os.environ.get('CANDLE_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'candles'))
+
+
+def archive_path(directory: str, timeframe: str, pair: str) -> str:
+    return os.path.join(directory, "%s_%s.bin" % (pair.replace('/', '_'), timeframe))
+
+
+def open_archive(timeframe: str, pair: str) -> 'CandleArchive':
+    return CandleArchive(archive_path(CANDLE_ARCHIVE_DIR, timeframe, pair))
+
+
+class CandleArchive:
+    """Append-only file of fixed-width CANDLE_DTYPE records, memory mapped.
+
+    `data` is a read/write np.memmap over the whole file, so slicing it is
+    zero-copy and in-place updates of the newest candle write through to
+    disk. The file is never truncated while mapped: overlapping history is
+    overwritten record by record, and anything that cannot be merged in
+    place is written to a new file and swapped in with os.replace().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        self.data = self._map()
+
+    def _map(self) -> np.ndarray:
+        count = os.path.getsize(self.path) // CANDLE_DTYPE.itemsize
+        if not count:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        # a torn trailing record from a crash is simply left out of the map
+        return np.memmap(self.path, dtype=CANDLE_DTYPE, mode='r+', shape=(count,))
+
+    def __len__(self):
+        return len(self.data)
+
+    def _append(self, records: np.ndarray):
+        if not len(records):
+            return
+        with open(self.path, 'r+b') as f:
+            f.seek(len(self.data) * CANDLE_DTYPE.itemsize)
+            f.write(np.ascontiguousarray(records, dtype=CANDLE_DTYPE).tobytes())
+        self.data = self._map()
+
+    def _rewrite(self, records: np.ndarray):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(np.ascontiguousarray(records, dtype=CANDLE_DTYPE).tobytes())
+        os.replace(tmp, self.path)
+        self.data = self._map()
+
+    def append(self, records: np.ndarray):
+        """Append candles newer than the last archived one"""
+        with self.lock:
+            if len(self.data):
+                records = records[records['timestamp'] > self.data['timestamp'][-1]]
+            self._append(records)
+
+    def merge(self, records: np.ndarray):
+        """Merge a sorted window of candles, newer records win on overlap"""
+        with self.lock:
+            current = self.data
+            if not len(current):
+                self._append(records)
+                return
+            last = current['timestamp'][-1]
+            overlap = records[records['timestamp'] <= last]
+            if len(overlap):
+                index = np.searchsorted(current['timestamp'], overlap['timestamp'])
+                found = index < len(current)
+                found[found] = current['timestamp'][index[found]] == overlap['timestamp'][found]
+                if found.all():
+                    current[index] = overlap
+                else:
+                    # holes inside the archived range: rebuild the file once
+                    merged = np.concatenate((current, records))
+                    order = np.argsort(merged['timestamp'], kind='stable')
+                    merged = merged[order]
+                    keep = np.append(merged['timestamp'][1:] != merged['timestamp'][:-1], True)
+                    self._rewrite(merged[keep])
+                    return
+            self._append(records[records['timestamp'] > last])
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
@@ -0,0 +1,77 @@
+import threading
+from typing import Dict
+
+from market_stream import parse_valr_time, to_valr_pair
+
+# Bucket length of the base timeframes; derived timeframes follow
+# automatically through the resampler.
+TIMEFRAME_SECONDS = {
+    '5m': 300,
+    '1H': 3600,
+    '1D': 86400,
+}
+
+
+def new_candle(start: int, price: float, volume: float = 0.0) -> Dict:
+    return {
+        'timestamp': start,
+        'open': price,
+        'high': price,
+        'low': price,
+        'close': price,
+        'volume': volume,
+    }
+
+
+class CandleAggregator:
+    """Keeps the open candle of every timeframe up to date from trade ticks.
+
+    The series themselves live in storage; the aggregator reads the newest
+    candle, folds the trade into it (or rolls over to a new bucket when the
+    trade falls past the bucket end) and writes it back through
+    storage.put_candle().
+    """
+
+    def __init__(self, storage, timeframes=None):
+        self.storage = storage
+        self.pair_names = {to_valr_pair(pair): pair for pair in storage.pairs}
+        self.timeframes = timeframes or TIMEFRAME_SECONDS
+        self.lock = threading.Lock()
+        self.trades = 0
+
+    def add_trade(self, pair: str, price: float, quantity: float, traded_at: float):
+        volume = price * quantity
+        with self.lock:
+            self.trades += 1
+            for timeframe, period in self.timeframes.items():
+                last = self.storage.get_last_candle(timeframe, pair)
+                if last is None:
+                    start = int(traded_at // period * period)
+                    self.storage.put_candle(timeframe, pair, new_candle(start, price, volume))
+                    continue
+                if traded_at < last['timestamp']:
+                    # late trade for an already closed bucket
+                    continue
+                if traded_at < last['timestamp'] + period:
+                    last['high'] = max(last['high'], price)
+                    last['low'] = min(last['low'], price)
+                    last['close'] = price
+                    last['volume'] += volume
+                    self.storage.put_candle(timeframe, pair, last)
+                    continue
+                buckets = int((traded_at - last['timestamp']) // period)
+                # fill quiet buckets with flat candles like the upstream history does
+                for step in range(1, min(buckets, self.storage.max_candles.get(timeframe, 1))):
+                    start = last['timestamp'] + step * period
+                    self.storage.put_candle(timeframe, pair, new_candle(start, last['close']))
+                start = last['timestamp'] + buckets * period
+                self.storage.put_candle(timeframe, pair, new_candle(start, price, volume))
+
+    def on_new_trade(self, message: Dict):
+        """VALR NEW_TRADE hook"""
+        data = message.get('data', {})
+        valr_pair = data.get('currencyPair') or message.get('currencyPairSymbol')
+        pair = self.pair_names.get(valr_pair)
+        if not pair:
+            return
+        self.add_trade(pair, float(data['price']), float(data['quantity']), parse_valr_time(data['tradedAt']))
@@ -0,0 +1,298 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Set, Tuple
+
+from evm_follower import address_index
+
+# coin -> (concurrent requests, requests per second) for its chain provider;
+# COIN_SETTINGS[coin]['scan_concurrency'] / ['scan_rate'] override these
+PROVIDER_LIMITS = {
+    'BTC': (8, 20.0),
+    'ETH': (4, 4.0),
+    'BNB': (4, 4.0),
+    'TRX': (4, 10.0),
+    'SOL': (8, 10.0),
+    'USDT': (4, 4.0),
+}
+DEFAULT_LIMITS = (2, 2.0)
+
+# wallets idle for a while are checked less often, but at least every
+# MAX_IDLE_INTERVAL seconds
+IDLE_FACTOR = 24
+MAX_IDLE_INTERVAL = 600.0
+# addresses whose activity is pushed to us (ElectrumX subscriptions) only
+# need an occasional safety check
+WATCHED_IDLE_INTERVAL = 3600.0
+CYCLE_SLO = 300.0
+# how long a block follower reuses its deposit address index
+INDEX_TTL = 60.0
+
+
+class RateLimiter:
+    """Thread-safe token bucket"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class WalletState:
+    __slots__ = ('last_checked', 'last_changed')
+
+    def __init__(self):
+        self.last_checked = 0.0
+        self.last_changed = time.time()
+
+
+class DepositScanner:
+    """Scans every deposit wallet of a coin with bounded concurrency.
+
+    Balance and transaction lookups run on a per-coin pool and pass the
+    provider's rate limiter; crediting (update_wallet_balance) is
+    serialized against one shared list of known tx hashes. Wallets that
+    changed recently are scanned first and every cycle, wallets idle for
+    days only every MAX_IDLE_INTERVAL. Chains with a block follower
+    (follow) are also credited straight from the blocks they read, and
+    addresses the chain client can watch are scanned when it reports
+    activity (on_activity).
+    """
+
+    def __init__(self, storage, blockchain):
+        self.storage = storage
+        self.blockchain = blockchain
+        self.pools: Dict[str, ThreadPoolExecutor] = {}
+        self.limiters: Dict[str, RateLimiter] = {}
+        self.state: Dict[Tuple[str, str], WalletState] = {}
+        self.metrics: Dict[str, Dict] = {}
+        self.followers: Dict[str, object] = {}
+        self.indexes: Dict[str, Tuple] = {}
+        self.txhashes: Set[str] = set()
+        # (coin, address) of pushed scans queued or running
+        self.pushed: Set[Tuple[str, str]] = set()
+        self.credit_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def provider(self, coin: str):
+        with self.lock:
+            if coin not in self.pools:
+                concurrency, rate = PROVIDER_LIMITS.get(coin, DEFAULT_LIMITS)
+                settings = self.blockchain.coins.get(coin, {})
+                concurrency = settings.get('scan_concurrency', concurrency)
+                rate = settings.get('scan_rate', rate)
+                self.pools[coin] = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='scan-%s' % coin)
+                self.limiters[coin] = RateLimiter(rate)
+            return self.pools[coin], self.limiters[coin]
+
+    def due(self, state: WalletState, now: float, watched: bool = False) -> bool:
+        idle = now - state.last_changed
+        return now - state.last_checked >= min(WATCHED_IDLE_INTERVAL if watched else MAX_IDLE_INTERVAL, idle / IDLE_FACTOR)
+
+    def on_activity(self, coin: str, address: str):
+        """Pushed activity on a watched address: scan that wallet now, on the coin's pool"""
+        state = self.wallet_state(coin, address)
+        state.last_checked = 0.0
+        state.last_changed = time.time()
+        pool, _ = self.provider(coin)
+        with self.lock:
+            if (coin, address) in self.pushed:
+                return
+            self.pushed.add((coin, address))
+        pool.submit(self.scan_address, coin, address)
+
+    def scan_address(self, coin: str, address: str):
+        """Scan one wallet outside the cycle, for pushed activity"""
+        try:
+            wallet = next((wallet for wallet in self.storage.get_all_wallets([coin]) or [] if wallet.address == address), None)
+            if wallet is None:
+                return False
+            # credits against the shared hash set, which the cycle reloads
+            _, limiter = self.provider(coin)
+            cursor = self.storage.get_wallet_cursors(coin).get(address)
+            return self.scan_wallet(coin, wallet, self.wallet_state(coin, address), limiter, False, None, cursor)
+        except Exception as e:
+            print("%s push scan error %s: %s" % (coin, address, e))
+            return False
+        finally:
+            with self.lock:
+                self.pushed.discard((coin, address))
+
+    def watch(self, coin: str, wallets):
+        if coin in self.followers:
+            # the block follower sees every transfer to these addresses
+            return {wallet.address for wallet in wallets}
+        try:
+            return self.blockchain.watch_addresses(coin, [wallet.address for wallet in wallets], self.on_activity)
+        except Exception as e:
+            print("%s watch error: %s" % (coin, e))
+            return set()
+
+    def scan(self, coin: str, force: bool = False):
+        """One cycle over the coin's wallets.
+
+        Changed wallets read only transactions after their sync cursor;
+        force re-reads the recent history of every unwatched wallet.
+        """
+        started = time.monotonic()
+        pool, limiter = self.provider(coin)
+        wallets = self.storage.get_all_wallets([coin])
+        self.reload_hashes()
+        watched = self.watch(coin, wallets)
+        now = time.time()
+        queue = []
+        for wallet in wallets:
+            state = self.wallet_state(coin, wallet.address)
+            if force and wallet.address not in watched or self.due(state, now, wallet.address in watched):
+                queue.append((wallet, state))
+        # most recently active first, then the longest unchecked
+        queue.sort(key=lambda item: (-item[1].last_changed, item[1].last_checked))
+        known = self.prefetch(coin, [wallet for wallet, _ in queue], limiter)
+        cursors = self.storage.get_wallet_cursors(coin)
+        futures = [pool.submit(self.scan_wallet, coin, wallet, state, limiter, force and wallet.address not in watched,
+                               known.get(wallet.address), cursors.get(wallet.address))
+                   for wallet, state in queue]
+        changed = 0
+        errors = 0
+        for future in as_completed(futures):
+            try:
+                changed += future.result()
+            except Exception as e:
+                errors += 1
+                print("%s deposit scan error: %s" % (coin, e))
+        duration = time.monotonic() - started
+        metrics = self.metrics.setdefault(coin, {"cycles": 0, "sloBreaches": 0})
+        metrics.update({
+            "cycles": metrics["cycles"] + 1,
+            "lastCycle": datetime.now(),
+            "lastDuration": duration,
+            "wallets": len(wallets),
+            "scanned": len(queue),
+            "watched": len(watched),
+            "changed": changed,
+            "errors": errors,
+            "slo": CYCLE_SLO,
+        })
+        if duration > CYCLE_SLO:
+            metrics["sloBreaches"] += 1
+        print("%s DEPOSITS %s: %i/%i wallets scanned, %i changed, %i errors in %.1fs" % (
+            datetime.now(), coin, len(queue), len(wallets), changed, errors, duration))
+
+    def prefetch(self, coin: str, wallets, limiter: RateLimiter) -> Dict[str, Dict]:
+        """Balances the chain can read in bulk (Blockchain.get_balances), keyed by address"""
+        if not wallets:
+            return {}
+        limiter.acquire()
+        try:
+            return self.blockchain.get_balances(coin, wallets)
+        except Exception as e:
+            print("%s batch balance error: %s" % (coin, e))
+            return {}
+
+    def scan_wallet(self, coin, wallet, state: WalletState, limiter: RateLimiter, force: bool,
+                    known: Dict = None, cursor: Dict = None) -> int:
+        known = known or {}
+        if not all(network in known for network in (wallet.network or [coin])):
+            limiter.acquire()
+        walletbalance = self.blockchain.get_balance(wallet, known)
+        state.last_checked = time.time()
+        if int(float(walletbalance)) > self.blockchain.coins[coin]['min_send_amount']:
+            print("%i FORWARDING: %s %s" % (int(float(walletbalance)), coin, wallet.address))
+            self.blockchain.forward_to_hot(wallet)
+        changed = float(walletbalance) != float(wallet.hotwalet)
+        if changed:
+            state.last_changed = state.last_checked
+            print("%s BALANCE changed %s    %s = %s" % (coin, wallet.address, str(walletbalance), str(wallet.hotwalet)))
+        if changed or force:
+            limiter.acquire()
+            if force:
+                # periodic reconciliation over the recent window, independent of the cursor
+                self.credit(wallet, walletbalance, self.blockchain.get_transactions(wallet))
+            else:
+                transactions, synced = self.blockchain.get_new_transactions(wallet, cursor)
+                self.credit(wallet, walletbalance, transactions)
+                if synced != (cursor or {}):
+                    self.storage.set_wallet_cursor(coin, wallet.address, synced)
+        return int(changed)
+
+    def wallet_state(self, coin: str, address: str) -> WalletState:
+        state = self.state.get((coin, address))
+        if state is None:
+            state = self.state[(coin, address)] = WalletState()
+        return state
+
+    def reload_hashes(self):
+        hashes = self.storage.get_tx_hashes() or ()
+        # merged, not replaced: a credit running since the query keeps the hashes it added
+        with self.credit_lock:
+            self.txhashes.update(hashes)
+
+    def credit(self, wallet, walletbalance, transactions):
+        with self.credit_lock:
+            self.storage.update_wallet_balance(wallet, walletbalance, self.txhashes, transactions)
+
+    def address_index(self, coin: str, follower):
+        """Cached (index, native addresses, token holders) of a followed chain"""
+        expires, *index = self.indexes.get(coin, (0.0,))
+        if time.monotonic() < expires:
+            return index
+        coins = [coin] + sorted(set(follower.tokens.values()))
+        holders = self.storage.get_network_addresses(follower.network) if follower.network else {}
+        index = address_index(self.storage.get_all_wallets(coins) or [], holders)
+        self.indexes[coin] = (time.monotonic() + INDEX_TTL,) + index
+        return index
+
+    def follow(self, coin: str):
+        """Read the next confirmed blocks of a followed chain and credit deposits to our addresses
+
+        The follower's cursor only moves once every deposit in the blocks
+        is credited; if crediting raises, the same blocks are read again
+        next poll (crediting is de-duplicated by tx hash).
+        """
+        follower = self.followers.get(coin)
+        if follower is None:
+            follower = self.followers[coin] = self.blockchain.block_follower(coin, self.storage)
+        index, natives, holders = self.address_index(coin, follower)
+        deposits, cursor = follower.poll(natives, holders)
+        metrics = self.metrics.setdefault('blocks:%s' % coin, {"deposits": 0})
+        metrics.update({
+            "lastPoll": datetime.now(),
+            "deposits": metrics["deposits"] + len(deposits),
+            "reorgs": follower.reorgs,
+            "addresses": len(natives) + len(holders),
+        })
+        if deposits:
+            self.credit_deposits(coin, index, deposits)
+        if cursor is not None:
+            follower.save_cursor(*cursor)
+
+    def credit_deposits(self, coin: str, index, deposits):
+        self.reload_hashes()
+        found: Dict[Tuple[str, str], list] = {}
+        for deposit in deposits:
+            found.setdefault((deposit.coin, deposit.address), []).append(
+                {"hash": deposit.hash, "side": "Deposit", "amount": deposit.amount})
+        _, limiter = self.provider(coin)
+        for key, transactions in found.items():
+            wallet = index[key]
+            limiter.acquire()
+            walletbalance = self.blockchain.get_balance(wallet)
+            print("%s BLOCK DEPOSIT %s %s" % (wallet.coin, wallet.address, [tx['hash'] for tx in transactions]))
+            self.credit(wallet, walletbalance, transactions)
+            state = self.wallet_state(wallet.coin, wallet.address)
+            state.last_changed = time.time()
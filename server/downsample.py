@@ -0,0 +1,86 @@
+import numpy as np
+
+from resample import aggregate
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    the visual shape of the line. First and last points are always kept."""
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    every = (size - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = size - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, size)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the minimum and maximum of threshold // 2 equal buckets, in order"""
+    size = len(y)
+    buckets = threshold // 2
+    if threshold >= size or buckets < 1:
+        return np.arange(size)
+    edges = np.linspace(0, size, buckets + 1).astype(np.int64)
+    indices = []
+    for left, right in zip(edges[:-1], edges[1:]):
+        window = y[left:right]
+        indices.append(left + int(window.argmin()))
+        indices.append(left + int(window.argmax()))
+    return np.unique(indices)
+
+
+def downsample_line(data: np.ndarray, threshold: int, method: str = 'lttb') -> np.ndarray:
+    """Pick at most `threshold` candles whose closes draw the same line"""
+    if len(data) <= threshold:
+        return data
+    if method == 'minmax':
+        return data[minmax_indices(data['close'], threshold)]
+    return data[lttb_indices(data['timestamp'], data['close'], threshold)]
+
+
+def downsample_candles(data: np.ndarray, threshold: int) -> np.ndarray:
+    """Merge runs of neighbouring candles so at most `threshold` remain;
+    every merged candle keeps the high and low of its run"""
+    if len(data) <= threshold:
+        return data
+    starts = np.unique(np.linspace(0, len(data), threshold, endpoint=False).astype(np.int64))
+    return aggregate(data, starts)
+
+
+def sparkline(data: np.ndarray, step: int, points: int):
+    """Closes of the newest `points` buckets on a regular grid.
+
+    Returns (start, float32 closes); missing buckets repeat the previous
+    close so the client can rebuild timestamps as start + i * step.
+    """
+    closes = np.full(points, np.nan, dtype=np.float32)
+    if not len(data):
+        return None, closes
+    start = int(data['timestamp'][-1]) - (points - 1) * step
+    data = data[data['timestamp'] >= start]
+    closes[(data['timestamp'] - start) // step] = data['close']
+    valid = ~np.isnan(closes)
+    if valid.any():
+        # forward fill, then back fill anything before the first close
+        filled = np.where(valid, np.arange(points), 0)
+        np.maximum.accumulate(filled, out=filled)
+        closes = closes[filled]
+        closes[:np.argmax(valid)] = closes[np.argmax(valid)]
+    return start, closes
@@ -0,0 +1,212 @@
+import json
+import socket
+import ssl as ssllib
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TIMEOUT = 30
+PING_INTERVAL = 60
+BATCH_SIZE = 100
+CLIENT_NAME = 'anker'
+PROTOCOL_VERSION = '1.4'
+
+
+class ElectrumError(Exception):
+    pass
+
+
+class LineBuffer:
+    """Splits a byte stream into newline-terminated frames.
+
+    Bytes are appended to one bytearray and only the newly received part is
+    searched for b'\\n', so a large response arriving in many chunks costs
+    O(size) and multi-byte UTF-8 split across chunks is decoded whole.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self.buffer += data
+        lines = []
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', max(start, self.scanned))
+            if end < 0:
+                break
+            line = bytes(self.buffer[start:end])
+            if line.strip():
+                lines.append(line)
+            start = end + 1
+        if start:
+            del self.buffer[:start]
+        self.scanned = len(self.buffer)
+        return lines
+
+
+class ElectrumSession:
+    """Long-lived ElectrumX connection shared by every thread.
+
+    Requests are multiplexed by id over one TCP/TLS socket and a reader
+    thread resolves them, so many threads can wait on the same connection;
+    `batch` sends a list of calls as a single JSON-RPC array. A broken
+    connection fails the pending requests and the next call reconnects,
+    re-subscribing every scripthash. `on_status(scripthash, status)` is
+    called from the reader thread for subscription notifications and for
+    statuses that changed while we were disconnected.
+    """
+
+    def __init__(self, host: str, port: int, ssl: bool = True, on_status: Optional[Callable] = None):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.on_status = on_status
+        self.socket = None
+        self.id_counter = 0
+        self.pending: Dict[int, Future] = {}
+        self.subscriptions: Dict[str, Optional[str]] = {}
+        self.lock = threading.Lock()
+        self.connect_lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.reconnects = 0
+
+    def connect(self):
+        """Open the connection if needed; other callers wait until it is ready"""
+        with self.connect_lock:
+            if self.socket is not None:
+                return
+            sock = socket.create_connection((self.host, self.port), timeout=TIMEOUT)
+            if self.ssl:
+                context = ssllib.create_default_context()
+                sock = context.wrap_socket(sock, server_hostname=self.host)
+            sock.settimeout(PING_INTERVAL)
+            self.socket = sock
+            threading.Thread(target=self.read, args=(sock,), name='electrum-reader', daemon=True).start()
+            self.request("server.version", [CLIENT_NAME, PROTOCOL_VERSION])
+            if self.subscriptions:
+                self.reconnects += 1
+                self.resubscribe()
+
+    def close(self, error: Optional[Exception] = None):
+        with self.lock:
+            sock, self.socket = self.socket, None
+            pending, self.pending = self.pending, {}
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error or ElectrumError("connection closed"))
+
+    def read(self, sock):
+        buffer = LineBuffer()
+        try:
+            while True:
+                try:
+                    chunk = sock.recv(65536)
+                except socket.timeout:
+                    self.send([{"jsonrpc": "2.0", "id": self.next_id(), "method": "server.ping", "params": []}], sock)
+                    continue
+                if not chunk:
+                    raise ElectrumError("connection closed by server")
+                for line in buffer.feed(chunk):
+                    self.dispatch(json.loads(line))
+        except Exception as e:
+            if self.socket is sock:
+                print("ElectrumX connection lost: %s" % e)
+                self.close(ElectrumError(str(e)))
+
+    def dispatch(self, message):
+        for reply in message if isinstance(message, list) else [message]:
+            if 'id' not in reply or reply.get('id') is None:
+                if reply.get('method') == 'blockchain.scripthash.subscribe':
+                    scripthash, status = reply['params']
+                    self.status_changed(scripthash, status)
+                continue
+            with self.lock:
+                future = self.pending.pop(reply['id'], None)
+            if future is None or future.done():
+                continue
+            if reply.get('error'):
+                future.set_exception(ElectrumError(reply['error']))
+            else:
+                future.set_result(reply.get('result'))
+
+    def status_changed(self, scripthash: str, status: Optional[str]):
+        if self.subscriptions.get(scripthash) == status:
+            return
+        self.subscriptions[scripthash] = status
+        if self.on_status is not None:
+            try:
+                self.on_status(scripthash, status)
+            except Exception as e:
+                print("ElectrumX status callback error: %s" % e)
+
+    def next_id(self) -> int:
+        with self.lock:
+            self.id_counter += 1
+            return self.id_counter
+
+    def send(self, payload: List[Dict], sock=None):
+        data = json.dumps(payload if len(payload) > 1 else payload[0]) + '\n'
+        with self.write_lock:
+            (sock or self.socket).sendall(data.encode('utf-8'))
+
+    def batch(self, calls: List[Tuple[str, list]]) -> List:
+        """Results of calls sent as one request; failed calls come back as ElectrumError"""
+        if not calls:
+            return []
+        self.connect()
+        payload = []
+        futures = []
+        with self.lock:
+            for method, params in calls:
+                future = Future()
+                self.id_counter += 1
+                self.pending[self.id_counter] = future
+                payload.append({"jsonrpc": "2.0", "id": self.id_counter, "method": method, "params": params})
+                futures.append((self.id_counter, future))
+        try:
+            self.send(payload)
+        except Exception as e:
+            self.close(ElectrumError(str(e)))
+        results = []
+        for request_id, future in futures:
+            try:
+                results.append(future.result(TIMEOUT))
+            except Exception as e:
+                with self.lock:
+                    self.pending.pop(request_id, None)
+                results.append(e if isinstance(e, ElectrumError) else ElectrumError(str(e) or type(e).__name__))
+        return results
+
+    def request(self, method: str, params: list):
+        (result,) = self.batch([(method, params)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def batched(self, method: str, params: Iterable[list]) -> List:
+        """One method over many params, BATCH_SIZE calls per request"""
+        params = list(params)
+        results = []
+        for offset in range(0, len(params), BATCH_SIZE):
+            results += self.batch([(method, one) for one in params[offset:offset + BATCH_SIZE]])
+        return results
+
+    def subscribe(self, scripthashes: Iterable[str]):
+        """Subscribe scripthashes not subscribed yet; their current status is recorded silently"""
+        new = [scripthash for scripthash in scripthashes if scripthash not in self.subscriptions]
+        for scripthash, status in zip(new, self.batched("blockchain.scripthash.subscribe", ([s] for s in new))):
+            if not isinstance(status, Exception):
+                self.subscriptions[scripthash] = status
+
+    def resubscribe(self):
+        scripthashes = list(self.subscriptions)
+        for scripthash, status in zip(scripthashes, self.batched("blockchain.scripthash.subscribe", ([s] for s in scripthashes))):
+            if not isinstance(status, Exception):
+                self.status_changed(scripthash, status)
@@ -0,0 +1,132 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from json_rpc import rpc_batch
+
+# keccak('Transfer(address,address,uint256)')
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+DEFAULT_CONFIRMATIONS = 12
+MAX_BLOCKS = 100
+
+
+class Deposit(NamedTuple):
+    coin: str
+    address: str
+    hash: str
+    amount: int
+    block: int
+
+
+class EvmBlockFollower:
+    """Reads each new block of an EVM chain once and matches it against our addresses.
+
+    Native transfers come from eth_getBlockByNumber with full transactions,
+    token transfers from one eth_getLogs per poll filtered by our token
+    contracts and the Transfer topic. Only blocks `confirmations` deep are
+    read; if the next block's parentHash still disagrees with the saved
+    cursor, the cursor steps back `confirmations` blocks and they are read
+    again (crediting is de-duplicated by tx hash).
+
+    `load_cursor()` returns (block, hash) or None and `save_cursor(block,
+    hash)` persists it; without a cursor following starts at the current
+    confirmed head. poll() never saves: the caller saves the cursor it
+    returns once the deposits are credited, so a failure reads the same
+    blocks again. `tokens` maps contract -> token coin on `network`.
+    """
+
+    def __init__(self, coin: str, send: Callable, load_cursor: Callable, save_cursor: Callable,
+                 network: Optional[str] = None, tokens: Optional[Dict[str, str]] = None,
+                 confirmations: int = DEFAULT_CONFIRMATIONS, max_blocks: int = MAX_BLOCKS):
+        self.coin = coin
+        self.network = network
+        self.send = send
+        self.load_cursor = load_cursor
+        self.save_cursor = save_cursor
+        self.tokens = {contract.lower(): token for contract, token in (tokens or {}).items()}
+        self.confirmations = confirmations
+        self.max_blocks = max_blocks
+        self.reorgs = 0
+
+    def call(self, method: str, params: list):
+        (result,) = rpc_batch(self.send, [(method, params)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def poll(self, addresses: Set[str], holders: Set[str]) -> Tuple[List[Deposit], Optional[Tuple[int, Optional[str]]]]:
+        """(deposits in the next range of confirmed blocks, cursor to save after them)
+
+        addresses are our native deposit addresses, holders our token
+        holder addresses, both lower case. The cursor is None when there
+        is nothing new.
+        """
+        target = int(self.call("eth_blockNumber", []), 16) - self.confirmations
+        cursor = self.load_cursor()
+        if cursor is None:
+            return [], (target, None)
+        last, last_hash = cursor
+        start = last + 1
+        end = min(target, last + self.max_blocks)
+        if end < start:
+            return [], None
+        numbers = range(start, end + 1)
+        blocks = rpc_batch(self.send, [("eth_getBlockByNumber", [hex(number), True]) for number in numbers])
+        for number, block in zip(numbers, blocks):
+            if isinstance(block, Exception) or not block:
+                raise ValueError("%s block %i unavailable: %s" % (self.coin, number, block))
+        if last_hash and blocks[0]['parentHash'].lower() != last_hash.lower():
+            self.reorgs += 1
+            print("%s reorg below block %i, rescanning %i blocks" % (self.coin, start, self.confirmations))
+            return [], (max(0, last - self.confirmations), None)
+        deposits = []
+        for block in blocks:
+            number = int(block['number'], 16)
+            for tx in block.get('transactions', []):
+                to = (tx.get('to') or '').lower()
+                value = int(tx.get('value') or '0x0', 16)
+                if value and to in addresses:
+                    deposits.append(Deposit(self.coin, to, tx['hash'], value, number))
+        if self.tokens and holders:
+            deposits += self.token_transfers(start, end, holders)
+        return deposits, (end, blocks[-1]['hash'])
+
+    def token_transfers(self, start: int, end: int, holders: Set[str]) -> List[Deposit]:
+        logs = self.call("eth_getLogs", [{
+            "fromBlock": hex(start),
+            "toBlock": hex(end),
+            "address": list(self.tokens),
+            "topics": [TRANSFER_TOPIC],
+        }])
+        deposits = []
+        for log in logs:
+            topics = log.get('topics', [])
+            if log.get('removed') or len(topics) < 3:
+                continue
+            to = '0x' + topics[2][-40:].lower()
+            token = self.tokens.get(log['address'].lower())
+            if token is None or to not in holders:
+                continue
+            deposits.append(Deposit(token, to, log['transactionHash'], int(log['data'], 16), int(log['blockNumber'], 16)))
+        return deposits
+
+
+def address_index(wallets, holders: Dict[str, str]) -> Tuple[Dict[Tuple[str, str], object], Set[str], Set[str]]:
+    """(index keyed by (coin, lower address), native addresses, token holders)
+
+    wallets mixes native wallets, matched on their own address, and token
+    wallets, matched on the holder address of their owner's network wallet
+    (holders is email -> address).
+    """
+    index = {}
+    natives = set()
+    tokens = set()
+    for wallet in wallets:
+        if wallet.network:
+            holder = holders.get(wallet.email)
+            if holder is None:
+                continue
+            index[(wallet.coin, holder.lower())] = wallet
+            tokens.add(holder.lower())
+        else:
+            index[(wallet.coin, wallet.address.lower())] = wallet
+            natives.add(wallet.address.lower())
+    return index, natives, tokens
@@ -0,0 +1,132 @@
+from typing import Callable, Dict, List, Tuple
+
+from json_rpc import rpc_batch
+
+DEFAULT_BATCH_SIZE = 200
+MULTICALL_BATCH_SIZE = 500
+
+# Multicall3, deployed at the same address on Ethereum, BSC and most EVM chains
+MULTICALL3 = '0xcA11bde05977b3631167028862bE2a173976CA11'
+AGGREGATE3 = '82ad56cb'  # aggregate3((address,bool,bytes)[])
+BALANCE_OF = '70a08231'  # balanceOf(address)
+
+
+def get_balances(send: Callable, addresses: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                 block: str = 'latest') -> Tuple[Dict[str, int], Dict[str, Exception]]:
+    """eth_getBalance for many addresses, batch_size calls per HTTP request.
+
+    Returns (balances in wei, errors) keyed by address; an address that
+    failed is only in errors, so callers can retry it on its own.
+    """
+    balances: Dict[str, int] = {}
+    errors: Dict[str, Exception] = {}
+    for offset in range(0, len(addresses), batch_size):
+        chunk = addresses[offset:offset + batch_size]
+        results = rpc_batch(send, [("eth_getBalance", [address, block]) for address in chunk])
+        for address, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                errors[address] = result
+                continue
+            try:
+                balances[address] = int(result, 16)
+            except (TypeError, ValueError) as e:
+                errors[address] = e
+    return balances, errors
+
+
+def _word(value: int) -> str:
+    return '%064x' % value
+
+
+def _address_word(address: str) -> str:
+    return address.lower().replace('0x', '').rjust(64, '0')
+
+
+def _hex(value) -> str:
+    value = value.hex() if isinstance(value, (bytes, bytearray)) else value
+    return value[2:] if value.startswith('0x') else value
+
+
+def encode_balance_of(holder: str) -> str:
+    return '0x' + BALANCE_OF + _address_word(holder)
+
+
+def encode_aggregate3(calls: List[Tuple[str, str]]) -> str:
+    """Calldata of aggregate3 for (target, calldata) pairs, every call allowed to fail"""
+    heads = []
+    tails = []
+    offset = 32 * len(calls)
+    for target, data in calls:
+        data = _hex(data)
+        size = len(data) // 2
+        tail = _address_word(target) + _word(1) + _word(96) + _word(size) + data.ljust((size + 31) // 32 * 64, '0')
+        heads.append(_word(offset))
+        tails.append(tail)
+        offset += len(tail) // 2
+    return '0x' + AGGREGATE3 + _word(32) + _word(len(calls)) + ''.join(heads) + ''.join(tails)
+
+
+def decode_aggregate3(result) -> List[Tuple[bool, bytes]]:
+    """(success, returnData) per call from an aggregate3 return value"""
+    raw = bytes.fromhex(_hex(result))
+
+    def word(position: int) -> int:
+        return int.from_bytes(raw[position:position + 32], 'big')
+
+    start = word(0)
+    count = word(start)
+    items = start + 32
+    decoded = []
+    for i in range(count):
+        item = items + word(items + 32 * i)
+        data = item + word(item + 32)
+        size = word(data)
+        decoded.append((bool(word(item)), raw[data + 32:data + 32 + size]))
+    return decoded
+
+
+def get_token_balances(send: Callable, pairs: List[Tuple[str, str]], multicall: str = MULTICALL3,
+                       batch_size: int = MULTICALL_BATCH_SIZE, block: str = 'latest'
+                       ) -> Tuple[Dict[Tuple[str, str], int], Dict[Tuple[str, str], Exception]]:
+    """balanceOf for many (token, holder) pairs, batch_size pairs per Multicall3 eth_call.
+
+    All chunks go out in one JSON-RPC batch; a chunk whose aggregate call
+    fails (no Multicall3 on the node, gas limits) is read again with plain
+    batched balanceOf calls. Returns (balances, errors) keyed by pair.
+    """
+    balances: Dict[Tuple[str, str], int] = {}
+    errors: Dict[Tuple[str, str], Exception] = {}
+    chunks = [pairs[offset:offset + batch_size] for offset in range(0, len(pairs), batch_size)]
+    calls = [("eth_call", [{"to": multicall, "data": encode_aggregate3(
+        [(token, encode_balance_of(holder)) for token, holder in chunk])}, block]) for chunk in chunks]
+    fallback: List[Tuple[str, str]] = []
+    for chunk, result in zip(chunks, rpc_batch(send, calls)):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            decoded = decode_aggregate3(result)
+            if len(decoded) != len(chunk):
+                raise ValueError("multicall returned %i results for %i calls" % (len(decoded), len(chunk)))
+        except Exception:
+            fallback.extend(chunk)
+            continue
+        for pair, (success, data) in zip(chunk, decoded):
+            if success and len(data) >= 32:
+                balances[pair] = int.from_bytes(data[:32], 'big')
+            else:
+                errors[pair] = ValueError("balanceOf reverted")
+    for offset in range(0, len(fallback), DEFAULT_BATCH_SIZE):
+        chunk = fallback[offset:offset + DEFAULT_BATCH_SIZE]
+        results = rpc_batch(send, [("eth_call", [{"to": token, "data": encode_balance_of(holder)}, block])
+                                   for token, holder in chunk])
+        for pair, result in zip(chunk, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                data = _hex(result)
+                if not data:
+                    raise ValueError("empty balanceOf result")
+                balances[pair] = int(data[:64], 16)
+            except Exception as e:
+                errors[pair] = e
+    return balances, errors
@@ -0,0 +1,243 @@
+import math
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MAX_PERIOD = 1000
+MAX_PER_REQUEST = 10
+MAX_CACHED = 1024
+EWM_BLOCK = 256
+
+# name -> (default params, output columns); output columns starting with
+# '_' are internal state kept for incremental updates and never served
+INDICATORS = {
+    'sma': ((20,), ('sma',)),
+    'ema': ((20,), ('ema',)),
+    'rsi': ((14,), ('rsi', '_gain', '_loss')),
+    'bb': ((20, 2.0), ('middle', 'upper', 'lower')),
+    'vwap': ((), ('vwap',)),
+}
+
+
+def parse_indicators(value: str) -> List[Tuple[str, tuple]]:
+    """'sma:20,ema:50,bb:20:2,vwap' -> [('sma', (20,)), ...]; raises ValueError"""
+    result = []
+    items = value.split(',')
+    if len(items) > MAX_PER_REQUEST:
+        raise ValueError("At most %i indicators per request" % MAX_PER_REQUEST)
+    for item in items:
+        parts = item.strip().lower().split(':')
+        name = parts[0]
+        if name not in INDICATORS:
+            raise ValueError("Unknown indicator %s. Valid options: %s" % (name, ', '.join(INDICATORS)))
+        defaults = INDICATORS[name][0]
+        if len(parts) - 1 > len(defaults):
+            raise ValueError("Too many parameters for %s" % name)
+        params = list(defaults)
+        for i, raw in enumerate(parts[1:]):
+            params[i] = type(defaults[i])(raw)
+        if not all(math.isfinite(p) for p in params):
+            raise ValueError("%s parameters must be finite numbers" % name)
+        if params and not 1 <= params[0] <= MAX_PERIOD:
+            raise ValueError("%s period must be between 1 and %i" % (name, MAX_PERIOD))
+        result.append((name, tuple(params)))
+    return result
+
+
+def indicator_key(name: str, params: tuple) -> str:
+    return ':'.join([name] + ['%g' % p for p in params])
+
+
+def ewm(x: np.ndarray, alpha: float, init: float) -> np.ndarray:
+    """y[t] = (1 - alpha) * y[t-1] + alpha * x[t], seeded with y[-1] = init.
+
+    Solved in closed form per block of EWM_BLOCK samples so the decay
+    powers stay inside float64 range.
+    """
+    out = np.empty(len(x))
+    if alpha >= 1.0:
+        out[:] = x
+        return out
+    decay = 1.0 - alpha
+    powers = decay ** np.arange(EWM_BLOCK + 1)
+    prev = init
+    for start in range(0, len(x), EWM_BLOCK):
+        block = x[start:start + EWM_BLOCK]
+        n = len(block)
+        p = powers[1:n + 1]
+        out[start:start + n] = p * prev + alpha * np.cumsum(block / powers[:n]) * powers[:n]
+        prev = out[start + n - 1]
+    return out
+
+
+def _rolling(close: np.ndarray, n: int, start: int):
+    """Windows of n closes ending at every index >= start (first n-1 are undefined)"""
+    first = max(start, n - 1)
+    if first >= len(close):
+        return first, None
+    return first, sliding_window_view(close[first - n + 1:], n)
+
+
+def _sma(data, params, prev, start):
+    n, = params
+    out = {'sma': np.full(len(data), np.nan)}
+    if prev:
+        out['sma'][:start] = prev['sma'][:start]
+    first, windows = _rolling(data['close'], n, start)
+    if windows is not None:
+        out['sma'][first:] = windows.mean(axis=1)
+    return out
+
+
+def _ema(data, params, prev, start):
+    n, = params
+    close = data['close']
+    ema = np.empty(len(data))
+    if prev and start:
+        ema[:start] = prev['ema'][:start]
+        ema[start:] = ewm(close[start:], 2.0 / (n + 1), ema[start - 1])
+    elif len(close):
+        ema[:] = ewm(close, 2.0 / (n + 1), close[0])
+    return {'ema': ema}
+
+
+def _rsi(data, params, prev, start):
+    """Wilder RSI, averages seeded with the mean of the first n moves"""
+    n, = params
+    close = data['close']
+    out = {name: np.full(len(data), np.nan) for name in ('rsi', '_gain', '_loss')}
+    if len(close) <= n:
+        return out
+    change = np.diff(close, prepend=close[0])
+    gain = np.clip(change, 0, None)
+    loss = np.clip(-change, 0, None)
+    if prev and start > n:
+        for name in out:
+            out[name][:start] = prev[name][:start]
+        first = start
+    else:
+        out['_gain'][n] = gain[1:n + 1].mean()
+        out['_loss'][n] = loss[1:n + 1].mean()
+        first = n + 1
+    if first < len(close):
+        out['_gain'][first:] = ewm(gain[first:], 1.0 / n, out['_gain'][first - 1])
+        out['_loss'][first:] = ewm(loss[first:], 1.0 / n, out['_loss'][first - 1])
+    avg_gain = out['_gain'][n:]
+    avg_loss = out['_loss'][n:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['rsi'][n:] = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+    return out
+
+
+def _bb(data, params, prev, start):
+    n, k = int(params[0]), params[1]
+    out = {name: np.full(len(data), np.nan) for name in ('middle', 'upper', 'lower')}
+    if prev:
+        for name in out:
+            out[name][:start] = prev[name][:start]
+    first, windows = _rolling(data['close'], n, start)
+    if windows is not None:
+        middle = windows.mean(axis=1)
+        width = k * windows.std(axis=1)
+        out['middle'][first:] = middle
+        out['upper'][first:] = middle + width
+        out['lower'][first:] = middle - width
+    return out
+
+
+def _vwap(data, params, prev, start):
+    """VWAP anchored to the UTC day. Stored volume is quote volume, so base
+    volume is approximated as volume / close."""
+    vwap = np.empty(len(data))
+    days = data['timestamp'] // 86400
+    if prev and start:
+        # restart from the first candle of the day being updated
+        start = int(np.searchsorted(days, days[start], side='left'))
+        vwap[:start] = prev['vwap'][:start]
+    else:
+        start = 0
+    close = data['close'][start:]
+    typical = (data['high'][start:] + data['low'][start:] + close) / 3.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume = np.where(close > 0, data['volume'][start:] / close, 0.0)
+    days = days[start:]
+    if not len(days):
+        return {'vwap': vwap}
+    anchors = np.concatenate(([0], np.flatnonzero(np.diff(days)) + 1))
+    lengths = np.diff(np.append(anchors, len(days)))
+    pv = np.cumsum(typical * volume)
+    v = np.cumsum(volume)
+    pv -= np.repeat(np.concatenate(([0.0], pv[anchors[1:] - 1])), lengths)
+    v -= np.repeat(np.concatenate(([0.0], v[anchors[1:] - 1])), lengths)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap[start:] = np.where(v > 0, pv / v, typical)
+    return {'vwap': vwap}
+
+
+COMPUTE = {'sma': _sma, 'ema': _ema, 'rsi': _rsi, 'bb': _bb, 'vwap': _vwap}
+
+
+class IndicatorCache:
+    """Indicator columns per (pair, timeframe, indicator, params).
+
+    When a series only changed in its newest candle, or gained candles at
+    the end, just the affected tail is recomputed from the cached state;
+    anything else (a history reload, a shifted window) recomputes in full.
+    """
+
+    def __init__(self):
+        self.entries: Dict[tuple, tuple] = {}
+        self.lock = threading.Lock()
+
+    def get(self, pair: str, timeframe: str, name: str, params: tuple, data: np.ndarray, epoch: int) -> Dict[str, np.ndarray]:
+        key = (pair, timeframe, name, params)
+        with self.lock:
+            entry = self.entries.get(key)
+        prev = None
+        start = 0
+        if entry is not None:
+            old_epoch, old_timestamps, old_values = entry
+            count = len(old_timestamps)
+            if old_epoch == epoch and count and len(data) >= count \
+                    and data['timestamp'][0] == old_timestamps[0] \
+                    and data['timestamp'][count - 1] == old_timestamps[-1]:
+                prev = old_values
+                start = count - 1
+        values = COMPUTE[name](data, params, prev, start)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (epoch, data['timestamp'].copy(), values)
+            if len(self.entries) > MAX_CACHED:
+                del self.entries[next(iter(self.entries))]
+        return values
+
+    def build(self, series, indicators: List[Tuple[str, tuple]], tail: int) -> Dict:
+        """Payload for a CandleSeries over the same window the charts use"""
+        with series.lock:
+            epoch = series.epoch
+            data = series.data[-series.max_len:] if series.max_len else series.data
+            data = np.array(data)
+        columns = {
+            indicator_key(name, params): self.get(series.pair, series.timeframe, name, params, data, epoch)
+            for name, params in indicators
+        }
+        return to_payload(series.pair, series.timeframe, data, columns, tail)
+
+
+def to_payload(pair: str, timeframe: str, data: np.ndarray, columns: Dict[str, Dict[str, np.ndarray]], tail: int) -> Dict:
+    """JSON-ready dict of the newest `tail` points, undefined values as null"""
+    timestamps = data['timestamp'][-tail:]
+    indicators = {}
+    for key, values in columns.items():
+        indicators[key] = {
+            name: np.where(np.isnan(column[-tail:]), None, column[-tail:]).tolist()
+            for name, column in values.items() if not name.startswith('_')
+        }
+    return {
+        "pair": pair,
+        "timeframe": timeframe,
+        "timestamps": timestamps.tolist(),
+        "indicators": indicators,
+    }
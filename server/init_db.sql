@@ -160,3 +160,20 @@ CREATE INDEX IF NOT EXISTS idx_trades_user_id ON trades(user_id);
 CREATE INDEX IF NOT EXISTS idx_trades_pair ON trades(pair);
 CREATE INDEX IF NOT EXISTS idx_market_data_pair ON market_data(pair);
 CREATE INDEX IF NOT EXISTS idx_market_data_timestamp ON market_data(timestamp);
+
+-- Last block read by each chain follower
+CREATE TABLE IF NOT EXISTS chain_cursors (
+    chain VARCHAR(20) PRIMARY KEY,
+    block BIGINT NOT NULL,
+    hash VARCHAR(100),
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- History sync cursor of each deposit wallet
+CREATE TABLE IF NOT EXISTS wallet_cursors (
+    coin VARCHAR(20) NOT NULL,
+    address VARCHAR(200) NOT NULL,
+    cursor_data VARCHAR(500) NOT NULL,
+    updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (coin, address)
+);
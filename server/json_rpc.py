@@ -0,0 +1,65 @@
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+TIMEOUT = 30
+
+
+def http_transport(session: requests.Session, rpc_url: str) -> Callable[[List[Dict]], List[Dict]]:
+    """send(payload) posting a JSON-RPC batch to rpc_url"""
+    def send(payload: List[Dict]) -> List[Dict]:
+        response = session.post(rpc_url, json=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        replies = response.json()
+        if not isinstance(replies, list):
+            raise ValueError(replies.get('error') if isinstance(replies, dict) else replies)
+        return replies
+    return send
+
+
+def provider_transport(provider) -> Callable[[List[Dict]], List[Dict]]:
+    """send(payload) issuing each call through a web3 provider, e.g. EthereumTesterProvider
+
+    A call the provider raises on becomes an error reply, as a node would
+    answer it, instead of failing the whole batch.
+    """
+    def send(payload: List[Dict]) -> List[Dict]:
+        replies = []
+        for call in payload:
+            try:
+                reply = dict(provider.make_request(call['method'], call['params']))
+            except Exception as e:
+                reply = {"jsonrpc": "2.0", "error": {"message": str(e)}}
+            reply['id'] = call['id']
+            replies.append(reply)
+        return replies
+    return send
+
+
+def rpc_batch(send: Callable, calls: List[Tuple[str, list]]) -> List:
+    """Send calls as one JSON-RPC batch; returns result or Exception per call, in order.
+
+    If the node rejects the whole batch (HTTP error, non-list reply) it is
+    split in half and retried, down to single calls.
+    """
+    if not calls:
+        return []
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+               for i, (method, params) in enumerate(calls)]
+    try:
+        replies = send(payload)
+    except Exception as e:
+        if len(calls) == 1:
+            return [e]
+        middle = len(calls) // 2
+        return rpc_batch(send, calls[:middle]) + rpc_batch(send, calls[middle:])
+    results: List = [ValueError("no reply")] * len(calls)
+    for reply in replies:
+        index = reply.get('id')
+        if not isinstance(index, int) or not 0 <= index < len(calls):
+            continue
+        if 'error' in reply:
+            results[index] = ValueError(reply['error'])
+        else:
+            results[index] = reply.get('result')
+    return results
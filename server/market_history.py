@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HISTORY_URL = "https://min-api.cryptocompare.com/data/v2/%s"
+REQUEST_TIMEOUT = (5, 20)
+MAX_WORKERS = 16
+# cryptocompare's per-request maximum; longer gaps are paged
+REQUEST_LIMIT = 2000
+MAX_PAGES = 50
+
+# base timeframe -> (cryptocompare endpoint, aggregate, candles in a full load);
+# every other chart timeframe is resampled from these
+HISTORY_ENDPOINTS = {
+    '5m': ('histominute', 5, 2000),
+    '1H': ('histohour', 1, 1000),
+    '1D': ('histoday', 1, 2000),
+}
+
+
+class HistoryFetcher:
+    """Concurrent cryptocompare OHLCV downloader.
+
+    One keep-alive session is shared by a bounded worker pool; every request
+    has a timeout and is retried on connection errors and 429/5xx answers.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='history')
+
+    def fetch(self, pair: str, timeframe: str, limit: Optional[int] = None) -> List[Dict]:
+        """Get the raw cryptocompare candles for one pair and base timeframe, oldest first.
+
+        Without `limit` this is the timeframe's default window. A larger
+        limit (a long gap) is paged backwards with toTs, REQUEST_LIMIT
+        candles per request, up to MAX_PAGES requests.
+        """
+        endpoint, aggregate, window = HISTORY_ENDPOINTS[timeframe]
+        remaining = min(limit or window, REQUEST_LIMIT * MAX_PAGES)
+        candles = []
+        to_ts = None
+        while remaining > 0:
+            page = self.fetch_page(endpoint, aggregate, pair, min(remaining, REQUEST_LIMIT), to_ts)
+            if to_ts is not None:
+                page = [candle for candle in page if candle['time'] <= to_ts]
+            if not any(candle['close'] for candle in page):
+                # before the pair was listed
+                break
+            candles = page + candles
+            remaining -= len(page)
+            to_ts = page[0]['time'] - 1
+        return candles
+
+    def fetch_page(self, endpoint: str, aggregate: int, pair: str, limit: int, to_ts: Optional[int] = None) -> List[Dict]:
+        fsym, tsym = pair.split('/')
+        params = {'fsym': fsym, 'tsym': tsym, 'limit': limit, 'e': 'CCCAGG'}
+        if aggregate > 1:
+            params['aggregate'] = aggregate
+        if to_ts is not None:
+            params['toTs'] = to_ts
+        result = self.session.get(HISTORY_URL % endpoint, params=params, timeout=REQUEST_TIMEOUT)
+        result.raise_for_status()
+        data = result.json()
+        if data.get('Response') == 'Error':
+            raise Exception(data.get('Message', 'cryptocompare error'))
+        return data['Data']['Data']
+
+    def fetch_all(self, timeframes: List[str], pairs: List[str], limits: Optional[Dict] = None) -> Tuple[Dict, Dict]:
+        """Fetch every (timeframe, pair) concurrently.
+
+        `limits` optionally caps the candles requested per (timeframe, pair).
+        Returns (results, errors), both keyed by (timeframe, pair); one failed
+        pair never aborts the others.
+        """
+        limits = limits or {}
+        futures = {}
+        for timeframe in timeframes:
+            for pair in pairs:
+                limit = limits.get((timeframe, pair))
+                futures[self.pool.submit(self.fetch, pair, timeframe, limit)] = (timeframe, pair)
+        results = {}
+        errors = {}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+        return results, errors
@@ -0,0 +1,200 @@
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from serializer import dumps
+
+# One fixed-width record per candle; prices and volume as float64,
+# timestamp as unix seconds of the bucket start.
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+CANDLE_FIELDS = CANDLE_DTYPE.names
+
+
+def candles_from_cryptocompare(candles: List[Dict]) -> np.ndarray:
+    """Convert cryptocompare histo* rows into a candle record array"""
+    data = np.empty(len(candles), dtype=CANDLE_DTYPE)
+    if candles:
+        data['timestamp'] = [int(c['time']) for c in candles]
+        data['open'] = [c['open'] for c in candles]
+        data['high'] = [c['high'] for c in candles]
+        data['low'] = [c['low'] for c in candles]
+        data['close'] = [c['close'] for c in candles]
+        data['volume'] = [c['volumeto'] for c in candles]
+    return data
+
+
+def candle_rows(pair: str, data: np.ndarray, charttype: str = 'line') -> List[Dict]:
+    """/api/market/{pair} rows for a candle array, line or OHLCV"""
+    timestamps = data['timestamp'].tolist()
+    isotimes = [datetime.fromtimestamp(t).isoformat() for t in timestamps]
+    volumes = [str(v) for v in data['volume'].tolist()]
+    closes = [str(v) for v in data['close'].tolist()]
+    if charttype == 'OHLCV':
+        opens = [str(v) for v in data['open'].tolist()]
+        highs = [str(v) for v in data['high'].tolist()]
+        lows = [str(v) for v in data['low'].tolist()]
+        return [
+            {
+                "id": "%s-%i" % (pair, t),
+                "pair": pair,
+                "price": o,
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "change24h": "0.00",
+                "volume24h": v,
+                "timestamp": iso,
+            }
+            for t, iso, o, h, l, c, v in zip(timestamps, isotimes, opens, highs, lows, closes, volumes)
+        ]
+    # line charts plot the close of every bucket
+    return [
+        {
+            "id": "%s-%i" % (pair, t),
+            "pair": pair,
+            "price": c,
+            "change24h": "0.00",
+            "volume24h": v,
+            "timestamp": iso,
+        }
+        for t, iso, c, v in zip(timestamps, isotimes, closes, volumes)
+    ]
+
+
+class CandleSeries:
+    """Columnar OHLCV series for one (pair, timeframe).
+
+    Columns are views into one structured NumPy array; `version` is bumped
+    on every change so derived data can be cached against it, `epoch` only
+    when candles other than the newest may have changed. When an
+    archive is attached the array is its memory map and the series keeps
+    the full history instead of the last max_len candles.
+    """
+
+    def __init__(self, pair: str, timeframe: str, data: Optional[np.ndarray] = None, max_len: int = 0, archive=None):
+        self.pair = pair
+        self.timeframe = timeframe
+        self.max_len = max_len
+        self.archive = archive
+        if archive is not None:
+            data = archive.data
+        self.data = data if data is not None else np.empty(0, dtype=CANDLE_DTYPE)
+        self.version = 0
+        self.epoch = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self.data['timestamp']
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.data['close']
+
+    def replace(self, data: np.ndarray):
+        """Merge a fetched window by timestamp, fetched candles win on overlap"""
+        with self.lock:
+            if self.archive is not None:
+                self.archive.merge(data)
+                self.data = self.archive.data
+            else:
+                # history_limit only fetches the gap, so keep what is older than it
+                merged = np.concatenate((self.data, data))
+                merged = merged[np.argsort(merged['timestamp'], kind='stable')]
+                keep = np.append(merged['timestamp'][1:] != merged['timestamp'][:-1], True)
+                merged = merged[keep]
+                if self.max_len:
+                    merged = merged[-self.max_len:]
+                self.data = merged
+            self.version += 1
+            self.epoch += 1
+
+    def last(self) -> Optional[Dict]:
+        data = self.data
+        if not len(data):
+            return None
+        return {name: data[name][-1].item() for name in CANDLE_FIELDS}
+
+    def upsert(self, candle: Dict):
+        """Update the newest candle in place, or append a new one"""
+        with self.lock:
+            data = self.data
+            if len(data) and data['timestamp'][-1] == candle['timestamp']:
+                for name in CANDLE_FIELDS[1:]:
+                    data[name][-1] = candle[name]
+            else:
+                record = np.array([tuple(candle[name] for name in CANDLE_FIELDS)], dtype=CANDLE_DTYPE)
+                if self.archive is not None:
+                    self.archive.append(record)
+                    self.data = self.archive.data
+                else:
+                    data = np.concatenate((data, record))
+                    if self.max_len:
+                        data = data[-self.max_len:]
+                    self.data = data
+            self.version += 1
+
+    def to_rows(self, charttype: str = 'line', tail: int = 0) -> List[Dict]:
+        """Build the /api/market/{pair} rows straight from the columns"""
+        return candle_rows(self.pair, self.data[-tail:] if tail else self.data, charttype)
+
+    def to_json(self, charttype: str = 'line', tail: int = 0) -> bytes:
+        return dumps(self.to_rows(charttype, tail))
+
+
+class SeriesStore:
+    """All candle series keyed by (timeframe, pair), optionally archived on disk"""
+
+    def __init__(self, max_lens: Optional[Dict[str, int]] = None, open_archive: Optional[Callable] = None):
+        self.max_lens = max_lens or {}
+        # open_archive(timeframe, pair) -> CandleArchive, None keeps series in memory
+        self.open_archive = open_archive
+        self.series: Dict[Tuple[str, str], CandleSeries] = {}
+        self.lock = threading.Lock()
+
+    def get(self, timeframe: str, pair: str) -> Optional[CandleSeries]:
+        return self.series.get((timeframe, pair))
+
+    def get_or_create(self, timeframe: str, pair: str) -> CandleSeries:
+        series = self.series.get((timeframe, pair))
+        if series is None:
+            with self.lock:
+                series = self.series.get((timeframe, pair))
+                if series is None:
+                    archive = self.open_archive(timeframe, pair) if self.open_archive else None
+                    series = CandleSeries(pair, timeframe, max_len=self.max_lens.get(timeframe, 0), archive=archive)
+                    self.series[(timeframe, pair)] = series
+        return series
+
+    def load(self, timeframes: List[str], pairs: List[str]):
+        """Map every archived series so charts are available before any fetch"""
+        for timeframe in timeframes:
+            for pair in pairs:
+                self.get_or_create(timeframe, pair)
+
+    def timeframes(self) -> List[str]:
+        return sorted(set(timeframe for timeframe, pair in self.series))
+
+    def replace(self, timeframe: str, pair: str, data: np.ndarray):
+        self.get_or_create(timeframe, pair).replace(data)
+
+    def last(self, timeframe: str, pair: str) -> Optional[Dict]:
+        series = self.get(timeframe, pair)
+        return series.last() if series is not None else None
+
+    def upsert(self, timeframe: str, pair: str, candle: Dict):
+        self.get_or_create(timeframe, pair).upsert(candle)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from valr_python.ws_client import WebSocketClient
+from valr_python.enum import CurrencyPair, TradeEvent
+
+from config import VALR_KEY, VALR_SECRET
+
+RECONNECT_DELAY = 5.0
+STALE_AFTER = 120.0
+MAX_RECONNECT_DELAY = 120.0
+
+
+def to_valr_pair(pair: str) -> str:
+    """'BTC/ZAR' -> 'BTCZAR'"""
+    return pair.replace('/', '').upper()
+
+
+def parse_valr_time(value: str) -> float:
+    """Parse VALR ISO timestamps ('2019-04-25T19:51:55.393Z') to unix seconds"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class MarketStream:
+    """Long-lived VALR trade websocket running on its own thread.
+
+    Hooks are registered per TradeEvent name before start(); the stream
+    reconnects with backoff whenever the connection drops.
+    """
+
+    def __init__(self, pairs: List[str]):
+        self.pairs = {}
+        for pair in pairs:
+            valr_pair = to_valr_pair(pair)
+            if valr_pair in CurrencyPair.__members__:
+                self.pairs[valr_pair] = pair
+            else:
+                print("MarketStream: %s not available on VALR stream" % pair)
+        self.hooks: Dict[str, List[Callable]] = {}
+        self.thread = None
+        self.connected = False
+        self.last_message = 0.0
+
+    def add_hook(self, event: str, func: Callable):
+        self.hooks.setdefault(TradeEvent[event].name, []).append(func)
+
+    def healthy(self) -> bool:
+        """True while messages keep arriving on a live connection"""
+        return self.connected and time.time() - self.last_message < STALE_AFTER
+
+    def _dispatch(self, event):
+        def hook(data):
+            self.last_message = time.time()
+            for func in self.hooks.get(event, []):
+                try:
+                    func(data)
+                except Exception as e:
+                    print("MarketStream %s hook error: %s" % (event, e))
+        return hook
+
+    def start(self):
+        if self.thread or not self.pairs or not self.hooks:
+            return
+        self.thread = threading.Thread(target=self._run_forever, name='valr-market-stream', daemon=True)
+        self.thread.start()
+
+    def _run_forever(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        delay = RECONNECT_DELAY
+        while True:
+            client = WebSocketClient(
+                api_key=VALR_KEY,
+                api_secret=VALR_SECRET,
+                currency_pairs=list(self.pairs.keys()),
+                ws_type='trade',
+                trade_subscriptions=list(self.hooks.keys()),
+                hooks={event: self._dispatch(event) for event in self.hooks},
+            )
+            started = time.time()
+            try:
+                print("%s MarketStream connecting %s" % (datetime.now(), ','.join(self.pairs)))
+                self.connected = True
+                loop.run_until_complete(client.run())
+            except Exception as e:
+                print("MarketStream disconnected: %s" % e)
+            self.connected = False
+            if time.time() - started > MAX_RECONNECT_DELAY:
+                delay = RECONNECT_DELAY
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
@@ -0,0 +1,45 @@
+import threading
+from typing import Callable, Dict, List
+
+
+def user_channel(email: str) -> str:
+    return "user:%s" % email
+
+
+class PubSub:
+    """In-process publish/subscribe between storage and the websocket layer.
+
+    Callbacks run synchronously on the publisher's thread, so subscribers
+    that own an event loop must hand the event over themselves.
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, List[Callable]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel: str, callback: Callable):
+        with self.lock:
+            self.channels.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, channel: str, callback: Callable):
+        with self.lock:
+            callbacks = self.channels.get(channel)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self.channels[channel]
+
+    def has_subscribers(self, channel: str) -> bool:
+        return bool(self.channels.get(channel))
+
+    def publish(self, channel: str, event: Dict):
+        with self.lock:
+            callbacks = list(self.channels.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("pubsub %s callback error: %s" % (channel, e))
+
+
+pubsub = PubSub()
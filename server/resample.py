@@ -0,0 +1,124 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from market_series import CANDLE_DTYPE, CandleSeries, SeriesStore
+
+WEEK_OFFSET = 4 * 86400  # 1970-01-01 was a Thursday, weeks start on Monday
+
+# timeframe -> (base timeframe, bucket rule). A rule of None serves the
+# base as is; an int is a fixed bucket in seconds aligned to the epoch.
+TIMEFRAMES = {
+    '5m': ('5m', None),
+    '15m': ('5m', 900),
+    '1H': ('1H', None),
+    '4H': ('1H', 4 * 3600),
+    '1D': ('1D', None),
+    '1W': ('1D', 'week'),
+    '1M': ('1D', 'month'),
+}
+
+
+def bucket_starts(timestamps: np.ndarray, rule) -> np.ndarray:
+    """Start of the bucket every timestamp falls into, in unix seconds"""
+    if rule == 'week':
+        return (timestamps - WEEK_OFFSET) // 604800 * 604800 + WEEK_OFFSET
+    if rule == 'month':
+        months = timestamps.astype('datetime64[s]').astype('datetime64[M]')
+        return months.astype('datetime64[s]').astype(np.int64)
+    return timestamps // rule * rule
+
+
+def resample(data: np.ndarray, rule) -> np.ndarray:
+    """Aggregate a candle array into coarser buckets.
+
+    open is the first open, high/low the extremes, close the last close and
+    volume the sum of every bucket, all computed with ufunc.reduceat.
+    """
+    if not len(data):
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    buckets = bucket_starts(data['timestamp'], rule)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    out = aggregate(data, starts)
+    out['timestamp'] = buckets[starts]
+    return out
+
+
+def aggregate(data: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Merge the candles between consecutive `starts` indices into one each"""
+    ends = np.concatenate((starts[1:], [len(data)])) - 1
+    out = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    out['timestamp'] = data['timestamp'][starts]
+    out['open'] = data['open'][starts]
+    out['high'] = np.maximum.reduceat(data['high'], starts)
+    out['low'] = np.minimum.reduceat(data['low'], starts)
+    out['close'] = data['close'][ends]
+    out['volume'] = np.add.reduceat(data['volume'], starts)
+    return out
+
+
+class Resampler:
+    """Serves any timeframe in TIMEFRAMES from the base series in a SeriesStore.
+
+    Derived series are cached per (timeframe, pair) and rebuilt only when the
+    base series version moves. Archived bases can hold years of candles, so
+    only the newest max_len base candles are resampled.
+    """
+
+    def __init__(self, store: SeriesStore):
+        self.store = store
+        self.cache: Dict[Tuple[str, str], CandleSeries] = {}
+        self.lock = threading.Lock()
+
+    def get(self, timeframe: str, pair: str) -> Optional[CandleSeries]:
+        base_timeframe, rule = TIMEFRAMES[timeframe]
+        base = self.store.get(base_timeframe, pair)
+        if base is None or rule is None:
+            return base
+        key = (timeframe, pair)
+        derived = self.cache.get(key)
+        if derived is not None and derived.version == base.version:
+            return derived
+        with base.lock:
+            version = base.version
+            epoch = base.epoch
+            data = base.data
+            cut = base.max_len and len(data) > base.max_len
+            if cut:
+                data = data[-base.max_len:]
+            data = resample(data, rule)
+        if cut and len(data) > 1:
+            # the window most likely starts inside a bucket
+            data = data[1:]
+        derived = CandleSeries(pair, timeframe, data)
+        derived.version = version
+        derived.epoch = epoch
+        with self.lock:
+            self.cache[key] = derived
+        return derived
+
+    def range(self, timeframe: str, pair: str, start: Optional[int] = None, end: Optional[int] = None) -> Optional[np.ndarray]:
+        """Candles with start <= timestamp <= end, resampled on demand.
+
+        The base series is sliced by binary search on its sorted timestamps,
+        so archived history outside the chart window is reachable and base
+        timeframes are served as zero-copy views.
+        """
+        base_timeframe, rule = TIMEFRAMES[timeframe]
+        base = self.store.get(base_timeframe, pair)
+        if base is None:
+            return None
+        if rule is not None and start is not None:
+            # include the whole bucket `start` falls into
+            start = int(bucket_starts(np.array([start], dtype=np.int64), rule)[0])
+        data = base.data
+        timestamps = data['timestamp']
+        left = np.searchsorted(timestamps, start, side='left') if start is not None else 0
+        right = np.searchsorted(timestamps, end, side='right') if end is not None else len(data)
+        data = data[left:right]
+        if rule is not None:
+            data = resample(data, rule)
+            if end is not None:
+                data = data[data['timestamp'] <= end]
+        return data
@@ -0,0 +1,52 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Union
+
+GZIP_LEVEL = 6
+MIN_COMPRESS_SIZE = 1024
+MAX_ENTRIES = 512
+
+
+class EncodedResponse:
+    """A response body encoded once: raw bytes, gzip bytes and a strong ETag"""
+
+    __slots__ = ('version', 'body', 'gzipped', 'etag')
+
+    def __init__(self, version: Hashable, body: bytes):
+        self.version = version
+        self.body = body
+        self.gzipped: Optional[bytes] = gzip.compress(body, GZIP_LEVEL) if len(body) >= MIN_COMPRESS_SIZE else None
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """Versioned cache of pre-serialized responses.
+
+    get() returns the stored payload while the caller's version matches and
+    only calls build() when the underlying data moved on. Entries are kept
+    in LRU order and bounded by MAX_ENTRIES.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Hashable, EncodedResponse]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Union[str, bytes]]) -> EncodedResponse:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version:
+                self.entries.move_to_end(key)
+                return entry
+        body = build()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        entry = EncodedResponse(version, body)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
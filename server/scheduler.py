@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class Job:
+    """One named periodic job and its run statistics"""
+
+    def __init__(self, name: str, func: Callable, interval: float, jitter: float = 0.0,
+                 initial_delay: Optional[float] = None, pool: str = 'default', args: tuple = ()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = interval if initial_delay is None else initial_delay
+        self.pool = pool
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started: Optional[datetime] = None
+        self.last_success: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[datetime] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "pool": self.pool,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "lastStarted": self.last_started,
+            "lastSuccess": self.last_success,
+            "lastDuration": self.last_duration,
+            "maxDuration": self.max_duration,
+            "lastError": self.last_error,
+            "nextRun": self.next_run,
+        }
+
+
+class Scheduler:
+    """Runs blocking jobs on bounded thread pools from the asyncio loop.
+
+    Each job sleeps interval + random jitter after its previous run ends,
+    so a run never overlaps itself; a manual trigger while it is running is
+    refused and counted as skipped.
+    """
+
+    def __init__(self, pools: Dict[str, int]):
+        self.executors = {
+            name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-%s' % name)
+            for name, workers in pools.items()
+        }
+        self.jobs: Dict[str, Job] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.tasks: List[asyncio.Task] = []
+
+    def add(self, name: str, func: Callable, interval: float, **kwargs) -> Job:
+        job = Job(name, func, interval, **kwargs)
+        if job.pool not in self.executors:
+            raise ValueError("Unknown pool %s for job %s" % (job.pool, name))
+        self.jobs[name] = job
+        if self.loop is not None:
+            self.tasks.append(self.loop.create_task(self._schedule(job)))
+        return job
+
+    def start(self):
+        """Start every job loop; call from the event loop thread"""
+        self.loop = asyncio.get_event_loop()
+        for job in self.jobs.values():
+            self.tasks.append(self.loop.create_task(self._schedule(job)))
+
+    async def _schedule(self, job: Job):
+        delay = job.initial_delay
+        while True:
+            job.next_run = datetime.fromtimestamp(time.time() + delay)
+            await asyncio.sleep(delay)
+            await self.run(job)
+            delay = job.interval + random.uniform(0, job.jitter)
+
+    async def run(self, job: Job) -> bool:
+        if job.running:
+            job.skipped += 1
+            return False
+        job.running = True
+        job.last_started = datetime.now()
+        started = time.monotonic()
+        try:
+            await asyncio.get_event_loop().run_in_executor(self.executors[job.pool], job.func, *job.args)
+            job.last_success = datetime.now()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            print("job %s failed: %s" % (job.name, e))
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            job.max_duration = max(job.max_duration, job.last_duration)
+        return True
+
+    def trigger(self, name: str) -> bool:
+        """Run a job now unless it is already running; call from the event loop thread"""
+        job = self.jobs[name]
+        if job.running:
+            job.skipped += 1
+            return False
+        asyncio.get_event_loop().create_task(self.run(job))
+        return True
+
+    def status(self) -> List[Dict]:
+        return [job.as_dict() for job in self.jobs.values()]
@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence
+
+from pydantic import BaseModel, TypeAdapter
+
+# Optional orjson import, the stdlib encoder is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_adapters: Dict[type, TypeAdapter] = {}
+
+
+def _adapter(cls: type) -> TypeAdapter:
+    adapter = _adapters.get(cls)
+    if adapter is None:
+        adapter = _adapters[cls] = TypeAdapter(List[cls])
+    return adapter
+
+
+def _default(o: Any):
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    if isinstance(o, BaseModel):
+        return o.model_dump(mode='json', by_alias=True)
+    raise TypeError("Object of type %s is not JSON serializable" % type(o).__name__)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode plain dicts/lists to JSON bytes; datetime, Decimal and models handled natively"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def jsonable(models: Sequence[BaseModel], by_alias: bool = True) -> List[Dict]:
+    """Dump a homogeneous list of models to JSON-ready dicts in one pydantic-core pass"""
+    if not models:
+        return []
+    return _adapter(type(models[0])).dump_python(list(models), mode='json', by_alias=by_alias)
+
+
+def dump_models(models: Sequence[BaseModel], by_alias: bool = True) -> bytes:
+    """JSON array of models, serialized straight to bytes by pydantic-core"""
+    if not models:
+        return b'[]'
+    return _adapter(type(models[0])).dump_json(list(models), by_alias=by_alias)
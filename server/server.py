@@ -10,7 +10,6 @@ import tornado.httpserver
 import tornado.websocket
 import json
 import random
-import threading
 import requests
 import numbers
 import time
@@ -18,6 +17,7 @@ import smtplib
 import pyotp
 import hashlib
 import hmac
+import gzip
 
 from email.mime.text import MIMEText
 from typing import Optional, Set
@@ -38,11 +38,27 @@ except ImportError:
     TWILIO_AVAILABLE = False
     Client = None
 
+# Optional brotli import for response compression
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 from tornado.options import define, options
 
 from auth_utils import auth_utils
 from models import InsertTrade, LoginRequest, RegisterRequest, User, InsertUser, NewWallet, NewBankAccount, FullWallet, SendTransaction,WithdrawTransaction
 from blockchain import blockchain
+from resample import TIMEFRAMES
+from response_cache import GZIP_LEVEL, MIN_COMPRESS_SIZE
+from serializer import dumps, jsonable
+from indicators import parse_indicators
+from ws_topics import TopicRegistry, topic_name, split_topic
+from ws_fanout import FanoutMetrics, SendQueue
+from pubsub import pubsub, user_channel
+from scheduler import Scheduler
+from deposit_scanner import DepositScanner
+from tx_cache import tx_cache
 
 from config import TESTNET, GOOGLE_CLIENT_ID, DATABASE_TYPE, APP_PORT, APP_HOST, COIN_SETTINGS, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, SMTP_SERVER, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, COIN_NETWORKS, SUMSUB_SECRET_KEY, SUMSUB_APP_TOKEN
 
@@ -51,42 +67,43 @@ if DATABASE_TYPE == 'postgresql':
 elif DATABASE_TYPE == 'mysql':
     from storage import storage
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        elif isinstance(o, (int, float)):
-            return str(o)
-        else:
-            return super().default(o)
-      
 class Application(tornado.web.Application):
     coins = {}
     
     def __init__(self):
         print("%s start starting" % datetime.now())
-        threading.Timer(60.0, self.wathcher).start()
         self.providers=[]
-        threading.Timer(1800.0, self.hourlywathcher).start()
+        self.deposit_steps = {}
+        self.deposits = DepositScanner(storage, blockchain)
+        # blocking jobs, started on the IOLoop by main()
+        # block followers get their own pool so slow explorer scans never hold them up
+        self.scheduler = Scheduler({'default': 4, 'deposits': 6, 'blocks': 3})
+        self.scheduler.add('prices', self.wathcher, 60.0)
+        self.scheduler.add('history', self.hourlywathcher, 1800.0, jitter=60.0)
+        self.scheduler.add('cacheclearer', storage.cacheclearer, 120.0)
         if not TESTNET:
-          threading.Timer(10.0, self.zar_wathcher).start()
-          threading.Timer(200.0, self.deposit_wathcher, args=('BTC',77,)).start()
-          threading.Timer(70.0, self.deposit_wathcher, args=('ETH',77,)).start()
-          threading.Timer(90.0, self.deposit_wathcher, args=('BNB',77,)).start()
-          threading.Timer(140.0, self.deposit_wathcher, args=('TRX',77,)).start()
-          threading.Timer(210.0, self.deposit_wathcher, args=('SOL',77,)).start()
+          self.scheduler.add('zar', self.zar_wathcher, 180.0, jitter=10.0, initial_delay=10.0)
+          for coin, delay in (('BTC', 200.0), ('ETH', 70.0), ('BNB', 90.0), ('TRX', 140.0), ('SOL', 210.0)):
+            self.scheduler.add('deposits:%s' % coin, self.deposit_wathcher, 77.0, jitter=10.0,
+                               initial_delay=delay, pool='deposits', args=(coin,))
+          for coin in ('ETH', 'BNB', 'TRX'):
+            self.scheduler.add('blocks:%s' % coin, self.deposits.follow, 15.0, initial_delay=20.0,
+                               pool='blocks', args=(coin,))
         else:
-          threading.Timer(1.0, self.deposit_wathcher, args=('USDT',77,)).start()
+          self.scheduler.add('deposits:USDT', self.deposit_wathcher, 77.0, initial_delay=1.0, pool='deposits', args=('USDT',))
 
         blockchain.generate_main_wallet()
         self.getproviders()
         
         # Initialize rewards system
         storage.initialize_rewards()
+        storage.initialize_chain_cursors()
     
 
         handlers = [
             # API routes
+            (r"/api/market/sparklines", SparklinesHandler),
+            (r"/api/market/(.+)/indicators", IndicatorsHandler),
             (r"/api/market/(.+)", MarketDataHandler),
             (r"/api/market", MarketDataHandler),
             (r"/api/transactions/(.+)", TransactionsHandler),
@@ -149,48 +166,40 @@ class Application(tornado.web.Application):
             
             # WebSocket route
             (r"/ws", WebSocketHandler),
+            (r"/api/ws/metrics", WebSocketMetricsHandler),
+            (r"/api/admin/jobs", JobsHandler),
+            (r"/api/admin/jobs/([^/]+)/run", JobRunHandler),
+            (r"/api/admin/deposits", DepositScanHandler),
             (r'/.*', NotFoundHandler)
         ]
     
         settings = {
             "cookie_secret": "sdfg54dfg54dh454hf654",
-            "debug": True
+            "debug": True,
+            # detect dead websocket peers
+            "websocket_ping_interval": 20,
+            "websocket_ping_timeout": 60,
         }
         super(Application, self).__init__(handlers, **settings)
+        self.add_transform(CompressedContentEncoding)
+        storage.stream.add_hook('NEW_TRADE', WebSocketHandler.on_trade)
+        storage.stream.add_hook('AGGREGATED_ORDERBOOK_UPDATE', WebSocketHandler.on_orderbook)
 
     def wathcher(self):
-        try:
-          print("\n%s \n" % datetime.now())
-          storage.update_latest_prices()
-        except Exception as e: print(e)
-        threading.Timer(60.0, self.wathcher).start()
+        print("\n%s \n" % datetime.now())
+        storage.update_latest_prices()
+        WebSocketHandler.broadcast_market_update(storage.get_all_market_data())
 
     def hourlywathcher(self):
-        try:
-          print("\n%s \n" % datetime.now())
-          storage._initialize_market_data()
-        except Exception as e: print(e)
-        threading.Timer(1800.0, self.hourlywathcher).start()
+        print("\n%s \n" % datetime.now())
+        storage._initialize_market_data()
 
-    def deposit_wathcher(self, coin, timer, step=0):
-        step +=1
+    def deposit_wathcher(self, coin):
+        step = self.deposit_steps.get(coin, 0) + 1
         try:
           print("\n%s DEPOSITS: %s" % (datetime.now(), coin))
-          allwallets = storage.get_all_wallets([coin])
-          txhashes = storage.get_tx_hashes()
-          for onewallet in allwallets:
-            #print(coin + " " + onewallet.address) 
-            walletbalance = blockchain.get_balance(onewallet)
-            if int(float(walletbalance)) > COIN_SETTINGS[onewallet.coin]['min_send_amount']:
-              print("%i FORWARDING: %s %s" % (int(float(walletbalance)), coin, onewallet.address)) 
-              blockchain.forward_to_hot(onewallet)
-              
-            if float(walletbalance) != float(onewallet.hotwalet) or step == 1:
-              print("%s BALANCE changed %s    %s = %s" % (coin, onewallet.address, str(walletbalance), str(onewallet.hotwalet) ))
-              txhashes = storage.update_wallet_balance(onewallet, walletbalance, txhashes)
-            if coin == 'ETH' or coin == 'BNB':
-              time.sleep(30)
-
+          # followed chains see every deposit in blocks; no need for full history sweeps
+          self.deposits.scan(coin, force=(step == 1 and coin not in self.deposits.followers))
         except Exception as e: print(e)
         try:
           print("MOVE PENDING " + coin)
@@ -202,7 +211,7 @@ class Application(tornado.web.Application):
         except Exception as e: print(e)
         if step > 7:
           step=0
-        threading.Timer(timer, self.deposit_wathcher, args=(coin,timer,step,)).start()
+        self.deposit_steps[coin] = step
 
 
     def coin_wathcher(self):
@@ -230,16 +239,10 @@ class Application(tornado.web.Application):
           print("\n%s check pending crypto\n" % datetime.now())
           storage.move_pending_crypto()
         except Exception as e: print(e)
-        
-        threading.Timer(77.0, self.coin_wathcher).start()
 
     def zar_wathcher(self):
-        try:
-          print("\n%s check pending ZAR\n" % datetime.now())
-          storage.move_pending_zar()
-        except Exception as e: print(e)
-
-        threading.Timer(180.0, self.zar_wathcher).start()
+        print("\n%s check pending ZAR\n" % datetime.now())
+        storage.move_pending_zar()
 
     def eth_wathcher(self):
         try:
@@ -259,7 +262,6 @@ class Application(tornado.web.Application):
               print("BALANCE changed")
               txhashes = storage.update_wallet_balance(onewallet, walletbalance, txhashes)
         except Exception as e: print(e)
-        threading.Timer(120.0, self.eth_wathcher).start()
       
 
     def sign_request(self, request: requests.Request) -> requests.PreparedRequest:
@@ -317,12 +319,51 @@ class Application(tornado.web.Application):
 
 
 
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+BROTLI_QUALITY = 4
+
+
+class CompressedContentEncoding(tornado.web.OutputTransform):
+    """gzip or brotli for buffered GET bodies, applied after Tornado's ETag / 304 check"""
+
+    def __init__(self, request):
+        accept = request.headers.get("Accept-Encoding", "") if request.method in ("GET", "HEAD") else ""
+        if brotli is not None and "br" in accept:
+            self.encoding = "br"
+        elif "gzip" in accept:
+            self.encoding = "gzip"
+        else:
+            self.encoding = None
+
+    def transform_first_chunk(self, status_code, headers, chunk, finishing):
+        if status_code != 200 or not headers.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES):
+            return status_code, headers, chunk
+        if "Vary" not in headers:
+            headers["Vary"] = "Accept-Encoding"
+        # streamed bodies and pre-encoded responses (write_encoded) go out as they are
+        if self.encoding is None or not finishing or "Content-Encoding" in headers or len(chunk) < MIN_COMPRESS_SIZE:
+            return status_code, headers, chunk
+        if self.encoding == "br":
+            chunk = brotli.compress(chunk, quality=BROTLI_QUALITY)
+        else:
+            chunk = gzip.compress(chunk, GZIP_LEVEL)
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(chunk))
+        return status_code, headers, chunk
+
+    def transform_chunk(self, chunk, finishing):
+        return chunk
+
+
 class BaseHandler(tornado.web.RequestHandler):
+    # Cache-Control of successful responses, errors are sent no-store; static-ish routes override it
+    cache_policy = "no-cache"
+
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
         self.set_header("Access-Control-Allow-Headers", "x-requested-with")
         self.set_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Cache-Control", self.cache_policy)
         self.set_header("Content-Type", "application/json")
 
     def write_error(self, status_code, **kwargs):
@@ -338,11 +379,36 @@ class BaseHandler(tornado.web.RequestHandler):
             self.write({"error": message})
 
     def write(self, chunk):
-        if isinstance(chunk, dict):
-            chunk = json.dumps(chunk, cls=DateTimeEncoder)
+        if isinstance(chunk, (dict, list)):
+            chunk = dumps(chunk)
             self.set_header("Content-Type", "application/json; charset=UTF-8")
         super().write(chunk)
-        
+
+    def write_encoded(self, response):
+        """Send a pre-serialized EncodedResponse, 304 when the client already has it"""
+        self.set_header("Etag", response.etag)
+        self.set_header("Vary", "Accept-Encoding")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        if response.gzipped is not None and "gzip" in self.request.headers.get("Accept-Encoding", ""):
+            self.set_header("Content-Encoding", "gzip")
+            super().write(response.gzipped)
+        else:
+            super().write(response.body)
+
+    def compute_etag(self):
+        # weak: the same body is sent gzip, brotli or identity encoded
+        etag = super().compute_etag()
+        return etag and 'W/' + etag
+
+    def finish(self, chunk=None):
+        if self.get_status() not in (200, 304):
+            # never let a proxy or browser keep an error
+            self.set_header("Cache-Control", "no-store")
+        return super().finish(chunk)
+
     def post(self):  # for all methods
         self.write({"code": 404,"msg": "Invalid API resource path."})
         
@@ -412,7 +478,7 @@ class RegisterHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
 
             # Return user data (without password)
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -475,7 +541,7 @@ class LoginHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
             
             # Return user data (without password)
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -590,7 +656,7 @@ class GoogleAuthHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
             
             # Return user data
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -661,7 +727,7 @@ class FacebookAuthHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
             
             # Return user data
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -732,7 +798,7 @@ class XAuthHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
             
             # Return user data
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -759,7 +825,7 @@ class MeHandler(BaseHandler):
                 return
             
             # Return user data (without password)
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
 
             # Get user profile with notification preferences and 2FA settings
@@ -857,7 +923,7 @@ class Auth2FAHandler(BaseHandler):
             self.set_secure_cookie("session_token", session_token, expires_days=7)
             
             # Return user data (without password)
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             # Add profile data
@@ -962,7 +1028,7 @@ class WalletCreateHandler(BaseHandler):
             
             self.write({
                 "success": True,
-                "wallet": wallet.dict(),
+                "wallet": wallet.model_dump(),
                 "message": "Wallet created successfully"
             })
             
@@ -1036,34 +1102,88 @@ class BankAccountCreateHandler(BaseHandler):
 
 
 class MarketDataHandler(BaseHandler):
+    def get_time_argument(self, name: str) -> Optional[int]:
+        """Unix time argument in seconds; millisecond values are accepted too"""
+        value = self.get_argument(name, None)
+        if value is None or value == "":
+            return None
+        value = int(float(value))
+        return value // 1000 if value > 10 ** 11 else value
+
     def get(self, pair: Optional[str] = None):
         try:
             # Get timeframe parameter with default of "1H"
             timeframe = self.get_argument("timeframe", "1H")
             charttype = self.get_argument("type", "line")
+            try:
+                limit = int(self.get_argument("limit", 0))
+                start = self.get_time_argument("from")
+                end = self.get_time_argument("to")
+                max_points = int(self.get_argument("maxPoints", 0))
+            except (ValueError, OverflowError):
+                self.set_status(400)
+                self.write({"error": "limit, from, to and maxPoints must be numbers"})
+                return
+            method = self.get_argument("downsample", "lttb")
 
             # Validate timeframe
-            valid_timeframes = ["1H", "1D", "1W", "1M"]
+            valid_timeframes = list(TIMEFRAMES.keys())
             if timeframe not in valid_timeframes:
                 self.set_status(400)
                 self.write({"error": f"Invalid timeframe. Valid options: {', '.join(valid_timeframes)}"})
                 return
             
             if pair:
-                print(f"Get specific pair data: /api/market/{pair}?timeframe={timeframe}")
-                data = storage.get_market_data(pair, timeframe, charttype)
-                self.write(json.dumps([item.dict(by_alias=True) for item in data], cls=DateTimeEncoder))
+                self.write_encoded(storage.get_market_response(pair, timeframe, charttype, limit, start, end, max_points, method))
             else:
-                print(f"Get all market data: /api/market?timeframe={timeframe}")
-                data = storage.get_all_market_data()
-                #print(data)
-                self.write(json.dumps([item.dict(by_alias=True) for item in data], cls=DateTimeEncoder))
+                self.write_encoded(storage.get_all_market_response())
         except Exception as e:
             print(e)
             self.set_status(500)
             self.write({"error": "Failed to fetch market data"})
 
 
+class SparklinesHandler(BaseHandler):
+    def get(self):
+        try:
+            timeframe = self.get_argument("timeframe", "1H")
+            valid_timeframes = storage.sparkline_timeframes()
+            if timeframe not in valid_timeframes:
+                self.set_status(400)
+                self.write({"error": f"Invalid timeframe. Valid options: {', '.join(valid_timeframes)}"})
+                return
+            self.write_encoded(storage.get_sparklines_response(timeframe))
+        except Exception as e:
+            print(e)
+            self.set_status(500)
+            self.write({"error": "Failed to fetch sparklines"})
+
+
+class IndicatorsHandler(BaseHandler):
+    def get(self, pair: str):
+        try:
+            timeframe = self.get_argument("timeframe", "1H")
+
+            valid_timeframes = list(TIMEFRAMES.keys())
+            if timeframe not in valid_timeframes:
+                self.set_status(400)
+                self.write({"error": f"Invalid timeframe. Valid options: {', '.join(valid_timeframes)}"})
+                return
+            try:
+                limit = int(self.get_argument("limit", 0))
+                indicators = parse_indicators(self.get_argument("set", "sma:20"))
+            except ValueError as e:
+                self.set_status(400)
+                self.write({"error": str(e)})
+                return
+
+            self.write_encoded(storage.get_indicators_response(pair, timeframe, indicators, limit))
+        except Exception as e:
+            print(e)
+            self.set_status(500)
+            self.write({"error": "Failed to calculate indicators"})
+
+
 class TradesHandler(BaseHandler):
     def post(self):
         try:
@@ -1076,7 +1196,7 @@ class TradesHandler(BaseHandler):
             trade_data = InsertTrade(**body)
             
             trade = storage.create_trade(trade_data, user)
-            self.write(trade.dict(by_alias=True))
+            self.write(trade.model_dump(by_alias=True))
         except ValidationError as e:
             print(e)
             self.set_status(400)
@@ -1096,7 +1216,7 @@ class UserTradesHandler(BaseHandler):
                 self.write({"error": "Authentication required"})
                 return
             trades = storage.get_user_trades(user)
-            self.write({"data": [trade.dict(by_alias=True) for trade in trades]})
+            self.write({"data": jsonable(trades)})
         except Exception as e:
             print(e)
             self.set_status(500)
@@ -1111,7 +1231,7 @@ class TransactionsHandler(BaseHandler):
                 self.write({"error": "Authentication required"})
                 return
             trades = storage.get_user_transactions(user)
-            self.write({"data": [trade.dict(by_alias=True) for trade in trades]})
+            self.write({"data": jsonable(trades)})
         except Exception as e:
             print(e)
             self.set_status(500)
@@ -1572,6 +1692,8 @@ class DepositHandler(BaseHandler):
 
 # Crypto metadata and tokens handlers
 class CryptocurrenciesHandler(BaseHandler):
+    cache_policy = "public, max-age=3600"
+
     def get(self):
         """Get cryptocurrency metadata (logos, colors, icons)"""
         try:
@@ -1818,6 +1940,8 @@ class TokenSearchHandler(BaseHandler):
             self.write({"error": "Failed to search tokens"})
 
 class ProvidersHandler(BaseHandler):
+    cache_policy = "public, max-age=300"
+
     def get(self):
         """Get list of exchange providers"""
         try:
@@ -1914,6 +2038,8 @@ class LeaderboardHandler(BaseHandler):
             self.write({"error": "Failed to get leaderboard"})
 
 class PopularWalletsHandler(BaseHandler):
+    cache_policy = "public, max-age=3600"
+
     def get(self):
         """Get popular wallet options for token swapping"""
         try:
@@ -1991,7 +2117,7 @@ class ProfileHandler(BaseHandler):
                 return
             
             # Return user profile data (without password)
-            user_data = user.dict()
+            user_data = user.model_dump()
             user_data.pop('password_hash', None)
             
             self.write({
@@ -2453,13 +2579,59 @@ class EmailVerificationVerifyHandler(BaseHandler):
             self.write({"error": str(e)})
 
 class WebSocketHandler(tornado.websocket.WebSocketHandler):
+    """/ws: market snapshot on connect, then per-topic subscriptions.
+
+    Client messages:
+        {"type": "subscribe", "pair": "BTC/ZAR", "channel": "ticker"}
+        {"type": "subscribe", "topic": "candles:1H:BTC/ZAR"}
+        {"type": "unsubscribe", "topic": ...}  (or pair + channel)
+        {"type": "resync", "topic": ...}       after a gap in seq
+        {"type": "subscribe", "channel": "private"}
+    Channels are ticker, orderbook and candles:<timeframe>. The private
+    channel needs the session_token cookie, sent from our own origin (or
+    WS_TRUSTED_ORIGINS), and pushes the user's wallet and transaction events.
+    """
     clients: Set['WebSocketHandler'] = set()
-    
+    io_loop = None
+    stall_checker = None
+    metrics = FanoutMetrics()
+    deflate = os.environ.get("WS_DEFLATE") == "1"
+    topics = TopicRegistry({
+        'ticker': lambda channel, pair: storage.get_ticker(pair),
+        'orderbook': lambda channel, pair: storage.get_orderbook(pair),
+        'candles': lambda channel, pair: storage.get_candle_state(channel.split(':', 1)[1], pair),
+    })
+
+    # origins besides our own host whose pages may use the private channel, comma separated
+    trusted_origins = {origin.strip().rstrip('/') for origin in os.environ.get("WS_TRUSTED_ORIGINS", "").split(",") if origin.strip()}
+    origin = None
+
     def check_origin(self, origin):
-        return True  # Allow all origins for development
+        # market data is public; the session cookie is only honoured for trusted_origin()
+        self.origin = origin
+        return True
+
+    def trusted_origin(self) -> bool:
+        """Our own frontend, or no browser at all: other sites must not ride the user's cookie"""
+        if self.origin is None:
+            return True
+        return self.origin.rstrip('/') in self.trusted_origins or super().check_origin(self.origin)
+
+    def get_compression_options(self):
+        # permessage-deflate trades CPU per client for bandwidth, off unless WS_DEFLATE=1
+        return {"compression_level": 5, "mem_level": 5} if self.deflate else None
     
     def open(self, *args, **kwargs):
+        if WebSocketHandler.io_loop is None:
+            WebSocketHandler.io_loop = tornado.ioloop.IOLoop.current()
+            WebSocketHandler.stall_checker = tornado.ioloop.PeriodicCallback(WebSocketHandler.close_stalled, 5000)
+            WebSocketHandler.stall_checker.start()
+        self.queue = SendQueue(self.write_message, self.metrics, on_overflow=self.close_overflowed)
+        self.user = self.get_current_user_from_session() if self.trusted_origin() else None
+        self.private = None
         self.clients.add(self)
+        self.metrics.connections = len(self.clients)
+        self.metrics.connections_total += 1
         print("WebSocket client connected")
         # Send initial market data
         self.send_initial_data()
@@ -2469,45 +2641,182 @@ class WebSocketHandler(tornado.websocket.WebSocketHandler):
             data = storage.get_all_market_data()
             message = {
                 "type": "market_data",
-                "data": [item.dict(by_alias=True) for item in data]
+                "data": jsonable(data)
             }
-            self.write_message(json.dumps(message, cls=DateTimeEncoder))
+            self.send(dumps(message))
         except Exception as e:
             print(e)
             print(f"Error sending initial data: {e}")
+
+    def send(self, message: bytes, topic=None):
+        """Queue an already encoded message; topic messages may be coalesced"""
+        if topic is None:
+            self.queue.put(message)
+        else:
+            self.queue.put(message, topic.name, topic.snapshot)
+
+    get_current_user_from_session = BaseHandler.get_current_user_from_session
+
+    def on_private_event(self, event):
+        """pubsub callback, called on the publishing thread"""
+        message = dumps({"type": "private", "data": event})
+        self.io_loop.add_callback(self.send, message)
+
+    def subscribe_private(self, subscribe: bool):
+        if subscribe and self.private is None:
+            self.private = user_channel(self.user.email)
+            pubsub.subscribe(self.private, self.on_private_event)
+            self.send(dumps({"type": "subscribed", "channel": "private"}))
+        elif not subscribe and self.private is not None:
+            pubsub.unsubscribe(self.private, self.on_private_event)
+            self.private = None
+
+    def topic_from(self, data) -> Optional[str]:
+        name = data.get("topic")
+        if not name and data.get("pair"):
+            name = topic_name(data.get("channel", "ticker"), data["pair"])
+        if not name or not self.topics.valid(name):
+            return None
+        channel, pair = split_topic(name)
+        if pair not in storage.activepairs:
+            return None
+        if channel.startswith("candles") and channel.split(':', 1)[-1] not in TIMEFRAMES:
+            return None
+        return name
     
     def on_message(self, message):
         try:
             data = json.loads(message)
-            if data.get("type") == "subscribe" and data.get("pair"):
-                print(f"Client subscribed to {data['pair']}")
+            kind = data.get("type")
+            if kind not in ("subscribe", "unsubscribe", "resync"):
+                return
+            if data.get("channel") == "private" or data.get("topic") == "private":
+                if not self.user:
+                    self.send(dumps({"type": "error", "message": "Authentication required"}))
+                    return
+                self.subscribe_private(kind != "unsubscribe")
+                return
+            name = self.topic_from(data)
+            if not name:
+                self.send(dumps({"type": "error", "message": "Unknown topic"}))
+                return
+            if kind == "subscribe":
+                self.topics.subscribe(self, name)
+            elif kind == "unsubscribe":
+                self.topics.unsubscribe(self, name)
+            else:
+                self.topics.resync(self, name)
         except json.JSONDecodeError as e:
             print(f"Invalid WebSocket message received: {e}")
     
     def on_close(self):
         self.clients.discard(self)
+        self.topics.remove(self)
+        if self.user:
+            self.subscribe_private(False)
+        self.queue.close()
+        self.metrics.connections = len(self.clients)
         print("WebSocket client disconnected")
-    
+
+    def close_overflowed(self):
+        # a private message could not be queued; the client reconnects and resyncs
+        self.close(1013, "Send queue full")
+
+    @classmethod
+    def close_stalled(cls):
+        """Disconnect clients whose last write has not drained for STALL_TIMEOUT"""
+        now = time.monotonic()
+        for client in list(cls.clients):
+            # a closed queue marks a client already being closed, counted once
+            if not client.queue.closed and client.queue.stalled(now):
+                cls.metrics.stalled += 1
+                client.queue.close()
+                # on_close follows once Tornado gives up on the handshake
+                client.close(1013, "Send queue stalled")
+
+    @classmethod
+    def stats(cls):
+        queued = [len(client.queue) for client in cls.clients]
+        return dict(
+            cls.metrics.as_dict(),
+            queued=sum(queued),
+            max_queue=max(queued) if queued else 0,
+            topics=len(cls.topics.topics),
+            subscriptions=sum(len(names) for names in cls.topics.subscriptions.values()),
+        )
+
+    @classmethod
+    def publish(cls, name: str, state):
+        """Thread-safe: hand a topic update to the IOLoop if anyone listens"""
+        if cls.io_loop is not None and cls.topics.has_subscribers(name):
+            cls.io_loop.add_callback(cls.topics.publish, name, state)
+
     @classmethod
     def broadcast_market_update(cls, data):
-        """Broadcast market data updates to all connected clients"""
-        if cls.clients:
-            message = {
-                "type": "market_data",
-                "data": [item.dict(by_alias=True) for item in data]
-            }
-            message_str = json.dumps(message, cls=DateTimeEncoder)
-            for client in cls.clients.copy():
-                try:
-                    client.write_message(message_str)
-                except Exception as e:
-                    print(e)
-                    cls.clients.discard(client)
+        """Send changed ticker fields to the subscribers of each pair"""
+        for item in data:
+            cls.publish(topic_name("ticker", item.pair), storage.get_ticker(item.pair))
+
+    @classmethod
+    def on_trade(cls, message):
+        """VALR NEW_TRADE hook, runs after the candle aggregator"""
+        pair = storage.stream.pairs.get(message.get("data", {}).get("currencyPair") or message.get("currencyPairSymbol"))
+        if not pair:
+            return
+        for timeframe in TIMEFRAMES:
+            name = topic_name("candles:%s" % timeframe, pair)
+            if cls.topics.has_subscribers(name):
+                cls.publish(name, storage.get_candle_state(timeframe, pair))
+
+    @classmethod
+    def on_orderbook(cls, message):
+        """VALR AGGREGATED_ORDERBOOK_UPDATE hook, runs after storage kept the book"""
+        pair = storage.stream.pairs.get(message.get("currencyPairSymbol"))
+        if pair:
+            cls.publish(topic_name("orderbook", pair), storage.get_orderbook(pair))
+
+class AdminHandler(BaseHandler):
+    """Requires X-Admin-Token to match the ADMIN_TOKEN environment variable"""
+
+    def prepare(self):
+        token = os.environ.get("ADMIN_TOKEN", "")
+        if not token or not hmac.compare_digest(self.request.headers.get("X-Admin-Token", ""), token):
+            self.set_status(403)
+            self.finish({"error": "Forbidden"})
+
+
+class WebSocketMetricsHandler(AdminHandler):
+    def get(self):
+        self.write(WebSocketHandler.stats())
+
+
+class JobsHandler(AdminHandler):
+    def get(self):
+        self.write({"jobs": self.application.scheduler.status()})
+
+
+class DepositScanHandler(AdminHandler):
+    def get(self):
+        self.write({"deposits": self.application.deposits.metrics, "txCache": tx_cache.stats()})
+
+
+class JobRunHandler(AdminHandler):
+    def post(self, name: str):
+        if name not in self.application.scheduler.jobs:
+            self.set_status(404)
+            self.write({"error": "Unknown job %s" % name})
+            return
+        started = self.application.scheduler.trigger(name)
+        if not started:
+            self.set_status(409)
+        self.write({"job": name, "started": started})
+
 
 def main():
     tornado.options.parse_command_line()
     app = Application()
     app.listen(APP_PORT, address=APP_HOST)
+    tornado.ioloop.IOLoop.current().add_callback(app.scheduler.start)
     #logging.getLogger('tornado.access').disabled = True
     tornado.ioloop.IOLoop.current().start()
 
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, Iterable, Set
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 120
+COMMITMENT = 'confirmed'
+
+
+def ws_url(rpc_url: str) -> str:
+    """Solana's pubsub endpoint lives on the RPC host: https -> wss, http -> ws"""
+    if rpc_url.startswith('https://'):
+        return 'wss://' + rpc_url[len('https://'):]
+    if rpc_url.startswith('http://'):
+        return 'ws://' + rpc_url[len('http://'):]
+    return rpc_url
+
+
+class SolanaWatcher:
+    """accountSubscribe for our SOL deposit addresses over one websocket.
+
+    Runs its own asyncio loop in a daemon thread; `watch` may be called
+    from any thread. Every accountNotification calls `on_change(address)`
+    from that thread. After a disconnect it reconnects with backoff and
+    subscribes everything again; `active` only holds addresses with a
+    confirmed subscription on the current connection.
+    """
+
+    def __init__(self, url: str, on_change: Callable):
+        self.url = url
+        self.on_change = on_change
+        self.addresses: Set[str] = set()
+        self.active: Set[str] = set()
+        self.subscriptions: Dict[int, str] = {}
+        self.requests: Dict[int, str] = {}
+        self.id_counter = 0
+        self.loop = None
+        self.connection = None
+        self.notifications = 0
+        self.reconnects = 0
+
+    def start(self):
+        if websockets is None:
+            print("websockets is not installed, Solana deposits stay polled")
+            return
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name='sol-watcher', daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+
+    def watch(self, addresses: Iterable[str]) -> Set[str]:
+        """Subscribe new addresses; returns the ones currently subscribed"""
+        if self.loop is None:
+            self.start()
+            if self.loop is None:
+                return set()
+        new = set(addresses) - self.addresses
+        if new:
+            self.addresses |= new
+            asyncio.run_coroutine_threadsafe(self.subscribe(new), self.loop)
+        return set(self.active)
+
+    async def subscribe(self, addresses: Iterable[str]):
+        if self.connection is None:
+            return
+        for address in addresses:
+            self.id_counter += 1
+            self.requests[self.id_counter] = address
+            await self.connection.send(json.dumps({
+                "jsonrpc": "2.0",
+                "id": self.id_counter,
+                "method": "accountSubscribe",
+                "params": [address, {"encoding": "base64", "commitment": COMMITMENT}],
+            }))
+
+    async def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                async with websockets.connect(self.url, max_size=None) as connection:
+                    self.connection = connection
+                    delay = RECONNECT_DELAY
+                    await self.subscribe(set(self.addresses))
+                    async for message in connection:
+                        self.dispatch(json.loads(message))
+            except Exception as e:
+                print("Solana websocket error: %s" % e)
+            self.connection = None
+            self.active.clear()
+            self.subscriptions.clear()
+            self.requests.clear()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def dispatch(self, message: Dict):
+        if 'id' in message:
+            address = self.requests.pop(message['id'], None)
+            if address is not None and isinstance(message.get('result'), int):
+                self.subscriptions[message['result']] = address
+                self.active.add(address)
+            elif address is not None:
+                print("Solana accountSubscribe %s failed: %s" % (address, message.get('error')))
+            return
+        if message.get('method') == 'accountNotification':
+            address = self.subscriptions.get(message['params']['subscription'])
+            if address is not None:
+                self.notifications += 1
+                try:
+                    self.on_change(address)
+                except Exception as e:
+                    print("Solana watcher callback error: %s" % e)
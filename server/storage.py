@@ -1,7 +1,8 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, timedelta
+import base64
+import json
 import random
-import requests
 import string
 import time
 import threading
@@ -10,10 +11,21 @@ import threading
 import pymysqlpool #pymysql-pool
 from valr_python import Client
 
-from models import User, InsertUser, Trade, InsertTrade, MarketData, Session, Wallet, BankAccount, NewWallet, FullWallet, NewBankAccount, OhlcvMarketData, Error, Transaction, VerificationCode, InsertVerificationCode, VerificationStatus, InsertVerificationStatus, UserProfile, InsertUserProfile
+from models import User, InsertUser, Trade, InsertTrade, MarketData, Session, Wallet, BankAccount, NewWallet, FullWallet, NewBankAccount, Error, Transaction, VerificationCode, InsertVerificationCode, VerificationStatus, InsertVerificationStatus, UserProfile, InsertUserProfile
 
 from config import COIN_NETWORKS, TESTNET, DB_USER, DB_PASSWORD, DB_NAME, DB_HOST, VALR_KEY, VALR_SECRET, COIN_SETTINGS, SUBACCOUNT, COIN_FORMATS, ACTIVEPAIRS
 from blockchain import blockchain
+from candles import CandleAggregator, TIMEFRAME_SECONDS
+from candle_archive import open_archive
+from market_stream import MarketStream
+from market_history import HistoryFetcher, HISTORY_ENDPOINTS
+from market_series import SeriesStore, candles_from_cryptocompare, candle_rows
+from resample import Resampler, TIMEFRAMES
+from downsample import downsample_candles, downsample_line, sparkline, METHODS as DOWNSAMPLE_METHODS
+from response_cache import ResponseCache, EncodedResponse
+from serializer import dump_models, dumps
+from indicators import IndicatorCache, indicator_key
+from pubsub import pubsub, user_channel
 
 class DataBase(object):
     def __init__(self, database):
@@ -63,18 +75,39 @@ class MySqlStorage:
         self.cache = {}
 
         self.trades: Dict[str, Trade] = {}
-        self.market_data: Dict[str, Dict[str, List[MarketData]]] = {}
-        self.ohlcv_market_data: Dict[str, Dict[str, List[OhlcvMarketData]]] = {}
         self.latest_prices: List[MarketData] = []
+        self.latest_prices_version = 0
+        self.responses = ResponseCache()
+        self.indicators = IndicatorCache()
         self.sessions: Dict[str, Session] = {}
         self.temp_sessions: Dict[str, Session] = {}
         self.pairs = ACTIVEPAIRS
         self.activepairs = self.pairs
+        self.chart_points = 181
+        self.max_chart_points = 10000
+        self.sparkline_points = 48
+        self.orderbooks: Dict[str, Dict] = {}
+        self.orderbook_depth = 20
+        self.max_candles = {timeframe: spec[2] for timeframe, spec in HISTORY_ENDPOINTS.items()}
+        self.series = SeriesStore(self.max_candles, open_archive if not TESTNET else None)
+        self.resampler = Resampler(self.series)
+        self.history = HistoryFetcher()
         self.usersfields = " id,email,username,password_hash,google_id,first_name,second_names,last_name,profile_image_url,is_active,created,updated,address,enabled2fa,code2fa,dob,gender,id_status,identity_number,referrer,sof,reference,phone,language,timezone,country "
         if not TESTNET:
-          self._initialize_market_data()
+          # charts are served from the on-disk archive straight away; only
+          # the gap since the last archived candle is downloaded
+          self.series.load(list(HISTORY_ENDPOINTS.keys()), self.activepairs)
+          if all(len(self.series.get(timeframe, pair)) for timeframe in HISTORY_ENDPOINTS for pair in self.activepairs):
+            threading.Thread(target=self._initialize_market_data, name='history-backfill', daemon=True).start()
+          else:
+            self._initialize_market_data()
+        self.candles = CandleAggregator(self)
+        self.stream = MarketStream(self.activepairs)
+        self.stream.add_hook('NEW_TRADE', self.candles.on_new_trade)
+        self.stream.add_hook('AGGREGATED_ORDERBOOK_UPDATE', self.on_orderbook_update)
         self.update_latest_prices()
-        threading.Timer(120.0, self.cacheclearer).start()
+        if not TESTNET:
+          self.stream.start()
 #        print(self.get_miner_fee())
 #        print("!!!!!!!!!!!!!!!")
 #        print(self.get_all_balances())
@@ -94,173 +127,40 @@ class MySqlStorage:
           except Exception as e: print(e)
         del newcache
       except Exception as e: print(e)
-      threading.Timer(120.0, self.cacheclearer).start()
-
-
-    def reinitialize_market_data_1h(self):
-        pairs = self.activepairs
-        
-        self.market_data['1H'] = {}
-        self.ohlcv_market_data['1H'] = {}
-          
-        for pair in pairs:
-            data = []
-            ohlcvdata = []
-            url = "https://min-api.cryptocompare.com/data/v2/histohour?fsym=%s&tsym=%s&limit=180&e=CCCAGG" % (pair.split('/')[0],pair.split('/')[1])
-            result = requests.get(url, headers={"Content-Type": "application/json"})
-            data72 = result.json()
-
-            # Generate 180 hours of hourly data
-            for step in data72['Data']['Data']:
-                ohlcvdata.append(OhlcvMarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    open=str(step['open']),
-                    high=str(step['high']),
-                    low=str(step['low']),
-                    close=str(step['close']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-                
-                data.append(MarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-            
-            self.ohlcv_market_data['1H'][pair] = ohlcvdata
-            self.market_data['1H'][pair] = data
-        print("1H re_initialized")
 
 
+    def history_limit(self, timeframe: str, pair: str) -> Optional[int]:
+        """Candles needed to close the gap after the newest stored one, None for a full window"""
+        last = self.series.last(timeframe, pair)
+        if last is None:
+            return None
+        # refetch the last two buckets as well, they may have been built live
+        return max(int(time.time() - last['timestamp']) // TIMEFRAME_SECONDS[timeframe], 0) + 2
+
+    def reinitialize_market_data(self, timeframes):
+        """Reload history for the given timeframes, all pairs fetched concurrently"""
+        started = time.time()
+        limits = {(timeframe, pair): self.history_limit(timeframe, pair) for timeframe in timeframes for pair in self.activepairs}
+        results, errors = self.history.fetch_all(timeframes, self.activepairs, limits)
+        for (timeframe, pair), candles in results.items():
+            # merged per pair so readers never see an empty timeframe
+            self.series.replace(timeframe, pair, candles_from_cryptocompare(candles))
+        for (timeframe, pair), error in errors.items():
+            print("%s %s history failed, keeping previous data: %s" % (timeframe, pair, error))
+        print("%s re_initialized in %.2fs (%i ok, %i failed)" % (','.join(timeframes), time.time() - started, len(results), len(errors)))
+
+    def reinitialize_market_data_5m(self):
+        self.reinitialize_market_data(['5m'])
 
+    def reinitialize_market_data_1h(self):
+        self.reinitialize_market_data(['1H'])
 
     def reinitialize_market_data_1d(self):
-        pairs = self.activepairs
-        self.market_data['1D'] = {}
-        self.ohlcv_market_data['1D'] = {}
-        for pair in pairs:
-            data = []
-            ohlcvdata = []
-            url = "https://min-api.cryptocompare.com/data/v2/histoday?fsym=%s&tsym=%s&limit=180&e=CCCAGG" % (pair.split('/')[0],pair.split('/')[1])
-            result = requests.get(url, headers={"Content-Type": "application/json"})
-            data72 = result.json()
-
-            # Generate 72 hours of hourly data
-            for step in data72['Data']['Data']:
-                ohlcvdata.append(OhlcvMarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    open=str(step['open']),
-                    high=str(step['high']),
-                    low=str(step['low']),
-                    close=str(step['close']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-                
-                data.append(MarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-            
-            self.ohlcv_market_data['1D'][pair] = ohlcvdata
-            self.market_data['1D'][pair] = data
-        print("1D re_initialized")
-
-
-    def reinitialize_market_data_1w(self):
-        pairs = self.activepairs
-        self.market_data['1W'] = {}
-        self.ohlcv_market_data['1W'] = {}
-        for pair in pairs:
-            data = []
-            ohlcvdata = []
-            url = "https://min-api.cryptocompare.com/data/v2/histoday?fsym=%s&tsym=%s&limit=180&aggregate=7&e=CCCAGG" % (pair.split('/')[0],pair.split('/')[1])
-            result = requests.get(url, headers={"Content-Type": "application/json"})
-            data72 = result.json()
-
-            # Generate 72 hours of hourly data
-            for step in data72['Data']['Data']:
-                ohlcvdata.append(OhlcvMarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    open=str(step['open']),
-                    high=str(step['high']),
-                    low=str(step['low']),
-                    close=str(step['close']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-                
-                data.append(MarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-            
-            self.ohlcv_market_data['1W'][pair] = ohlcvdata
-            self.market_data['1W'][pair] = data
-        print("1W re_initialized")
-
-
-    def reinitialize_market_data_1m(self):
-        pairs = self.activepairs
-
-        self.market_data['1M'] = {}
-        self.ohlcv_market_data['1M'] = {}
-        for pair in pairs:
-            data = []
-            ohlcvdata = []
-            url = "https://min-api.cryptocompare.com/data/v2/histoday?fsym=%s&tsym=%s&limit=180&aggregate=30&e=CCCAGG" % (pair.split('/')[0],pair.split('/')[1])
-            result = requests.get(url, headers={"Content-Type": "application/json"})
-            data72 = result.json()
-
-            # Generate 72 hours of hourly data
-            for step in data72['Data']['Data']:
-                ohlcvdata.append(OhlcvMarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    open=str(step['open']),
-                    high=str(step['high']),
-                    low=str(step['low']),
-                    close=str(step['close']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-                
-                data.append(MarketData(
-                    pair=pair,
-                    price=str(step['open']),
-                    change_24h="0.00",
-                    volume_24h=str(step['volumeto']),
-                    timestamp=datetime.fromtimestamp(int(step['time']))
-                ))
-            
-            self.ohlcv_market_data['1M'][pair] = ohlcvdata
-            self.market_data['1M'][pair] = data
-        print("1M re_initialized")
-
-
+        self.reinitialize_market_data(['1D'])
 
     def _initialize_market_data(self):
         print("_initialize_market_data")
-        self.reinitialize_market_data_1h()
-        self.reinitialize_market_data_1d()
-        self.reinitialize_market_data_1w()
-        self.reinitialize_market_data_1m()
+        self.reinitialize_market_data(list(HISTORY_ENDPOINTS.keys()))
         print("_initialize_market_data DONE")
             
 
@@ -303,11 +203,11 @@ class MySqlStorage:
 
     def get_tx_hashes(self):
         db = DataBase(DB_NAME)
-        uniqueidlist = []
+        uniqueids = set()
         allidx = db.query("SELECT txhash FROM transactions group by txhash")
         for idx in allidx:
-          uniqueidlist.append(idx[0])
-        return uniqueidlist
+          uniqueids.add(idx[0])
+        return uniqueids
 
     def fill_user(self, users) -> Optional[User]:
         if users:
@@ -366,18 +266,19 @@ class MySqlStorage:
                     timestamp=timestamp
                 )
                 all_data.append(data)
-                if pair in self.activepairs:
-                  try:
-                    self.market_data['1H'][pair][180].price = str(base_data['markPrice'])
-                    self.market_data['1D'][pair][180].price = str(base_data['markPrice'])
-                    self.market_data['1W'][pair][180].price = str(base_data['markPrice'])
-                    self.market_data['1M'][pair][len(self.market_data['1M'][pair])-1].price = str(base_data['markPrice'])
-                    self.ohlcv_market_data['1H'][pair][180].close = str(base_data['markPrice'])
-                    self.ohlcv_market_data['1D'][pair][180].close = str(base_data['markPrice'])
-                    self.ohlcv_market_data['1W'][pair][180].close = str(base_data['markPrice'])
-                    self.ohlcv_market_data['1M'][pair][len(self.ohlcv_market_data['1M'][pair])-1].close = str(base_data['markPrice'])
-                  except Exception as e: 
-                    print(e)
+                if pair in self.activepairs and not self.stream.healthy():
+                  # the trade stream keeps the open candles exact; without it fall back to the mark price
+                  markprice = float(base_data['markPrice'])
+                  for timeframe in self.series.timeframes():
+                    try:
+                      last = self.get_last_candle(timeframe, pair)
+                      if last:
+                        last['high'] = max(last['high'], markprice)
+                        last['low'] = min(last['low'], markprice)
+                        last['close'] = markprice
+                        self.put_candle(timeframe, pair, last)
+                    except Exception as e: 
+                      print(e)
                     
                 
             else:
@@ -390,9 +291,53 @@ class MySqlStorage:
                 )
                 all_data.append(data)
         self.latest_prices = all_data
+        self.latest_prices_version += 1
+        for timeframe in self.sparkline_timeframes():
+          try:
+            self.get_sparklines_response(timeframe)
+          except Exception as e:
+            print(e)
         print("update_latest_prices DONE")
               
 
+    def on_orderbook_update(self, message: Dict):
+        """VALR AGGREGATED_ORDERBOOK_UPDATE hook, keeps the top of the book per pair"""
+        pair = self.stream.pairs.get(message.get('currencyPairSymbol'))
+        if not pair:
+          return
+        data = message.get('data', {})
+        self.orderbooks[pair] = {
+          "bids": [[level['price'], level['quantity']] for level in data.get('Bids', [])[:self.orderbook_depth]],
+          "asks": [[level['price'], level['quantity']] for level in data.get('Asks', [])[:self.orderbook_depth]],
+        }
+
+    def get_orderbook(self, pair: str) -> Dict:
+        return self.orderbooks.get(pair, {"bids": [], "asks": []})
+
+    def get_ticker(self, pair: str) -> Dict:
+        """Latest price fields of one pair, without the per-update id"""
+        for item in self.latest_prices:
+          if item.pair == pair:
+            return {
+              "price": item.price,
+              "change24h": item.change24h,
+              "volume24h": item.volume24h,
+              "timestamp": item.timestamp.isoformat(),
+            }
+        return {}
+
+    def get_candle_state(self, timeframe: str, pair: str) -> Dict:
+        series = self.resampler.get(timeframe, pair)
+        candle = series.last() if series is not None else None
+        return candle or {}
+
+    def get_last_candle(self, timeframe: str, pair: str) -> Optional[Dict]:
+        return self.series.last(timeframe, pair)
+
+    def put_candle(self, timeframe: str, pair: str, candle: Dict):
+        """Update the newest candle of a series in place, or append a new one"""
+        self.series.upsert(timeframe, pair, candle)
+
     def get_valr(self):
         c = Client(api_key=VALR_KEY, api_secret=VALR_SECRET)
         c.rate_limiting_support = True
@@ -469,9 +414,12 @@ class MySqlStorage:
         if zaramount > 0:
           client = self.get_valr()
           client.post_internal_transfer_subaccounts('0',SUBACCOUNT,'ZAR',str(int(float(zaramount))))
+          emails = self.pending_wallet_emails(db, 'ZAR')
           sql = "update wallets set balance=(balance+0)+(pending+0), pending='0' where coin='ZAR' and pending != '0'"
           print(sql)
           success, account_id = db.execute(sql, return_id=True)
+          for email in emails:
+            self.notify_wallet(email, 'ZAR')
 
     def move_pending_crypto(self, coin):
         allonvalr = self.get_all_balances()
@@ -484,9 +432,46 @@ class MySqlStorage:
         balance = float(allonwallets[1])
         print("%s PENDING= %s balances= %s sumAmnt= %s onValr= %s " % (coin, str(pending),str(balance),str(pending+balance),str(onvalr)))
         if pending > 0 and balance + pending < onvalr:
+            emails = self.pending_wallet_emails(db, coin)
             sql = "update wallets set balance=(balance+0)+(pending+0), pending='0' where coin='%s' and pending <> '0'" % coin
             print("UPDATE PENDING \n" + sql)
             success, account_id = db.execute(sql, return_id=True)
+            for email in emails:
+              self.notify_wallet(email, coin)
+
+    def pending_wallet_emails(self, db, coin) -> List[str]:
+        """Owners of wallets with a pending amount, only looked up when someone listens"""
+        emails = db.query("select distinct email from wallets where coin='%s' and pending <> '0'" % coin) or []
+        return [row[0] for row in emails if pubsub.has_subscribers(user_channel(row[0]))]
+
+    def notify_wallet(self, email: str, coin: str):
+        """Push the current balance of one wallet to its owner's private channel"""
+        channel = user_channel(email)
+        if not pubsub.has_subscribers(channel):
+          return
+        try:
+          db = DataBase(DB_NAME)
+          wallets = db.query("select balance, pending from wallets where email='%s' and coin='%s'" % (email, coin))
+          if wallets:
+            pubsub.publish(channel, {
+              "type": "wallet",
+              "coin": coin,
+              "balance": str(wallets[0][0]),
+              "pending": str(wallets[0][1]),
+            })
+        except Exception as e:
+          print(e)
+
+    def notify_transaction(self, email: str, coin: str, side: str, amount, status: str = 'completed', txhash: str = ''):
+        pubsub.publish(user_channel(email), {
+          "type": "transaction",
+          "coin": coin,
+          "side": side,
+          "amount": str(amount),
+          "status": status,
+          "txhash": txhash,
+          "createdAt": datetime.now().isoformat(),
+        })
 
 
 
@@ -562,6 +547,80 @@ class MySqlStorage:
         else:
           return None
 
+    def get_network_addresses(self, network) -> Dict[str, str]:
+        """email -> address of every network wallet (ERC20, TRC20) in one query"""
+        sql = "select email,address from wallets where coin='%s'" % network
+        db = DataBase(DB_NAME)
+        return {wallet[0]: wallet[1] for wallet in db.query(sql) or []}
+
+    def initialize_chain_cursors(self):
+        """Create the cursor tables of the chain followers and the per-wallet history sync,
+        and the table of credited chain transactions"""
+        db = DataBase(DB_NAME)
+        sql = """
+        CREATE TABLE IF NOT EXISTS chain_cursors (
+            chain VARCHAR(20) PRIMARY KEY,
+            block BIGINT NOT NULL,
+            hash VARCHAR(100),
+            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """
+        db.execute(sql)
+        sql = """
+        CREATE TABLE IF NOT EXISTS wallet_cursors (
+            coin VARCHAR(20) NOT NULL,
+            address VARCHAR(200) NOT NULL,
+            cursor_data VARCHAR(500) NOT NULL,
+            updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (coin, address)
+        )
+        """
+        db.execute(sql)
+        sql = """
+        CREATE TABLE IF NOT EXISTS credited_txhashes (
+            txhash VARCHAR(200) NOT NULL,
+            email VARCHAR(200) NOT NULL,
+            coin VARCHAR(20) NOT NULL,
+            side VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (txhash, email, coin, side)
+        )
+        """
+        db.execute(sql)
+
+    def claim_tx_hash(self, db, wallet: FullWallet, tx) -> bool:
+        """Record a chain transaction as credited to a wallet; False if it already was
+
+        The primary key makes the insert fail for a hash credited before, by
+        this process or another one, so the balance is only touched once.
+        """
+        sql = "INSERT INTO credited_txhashes (txhash, email, coin, side) VALUES (%s, %s, %s, %s)"
+        return db.execute(sql, (tx['hash'], wallet.email, wallet.coin, tx['side'])) is True
+
+    def get_chain_cursor(self, chain):
+        """(block, hash) last processed by the chain follower, or None"""
+        db = DataBase(DB_NAME)
+        rows = db.query("SELECT block, hash FROM chain_cursors WHERE chain='%s'" % chain)
+        if rows:
+          return int(rows[0][0]), rows[0][1]
+        return None
+
+    def get_wallet_cursors(self, coin) -> Dict[str, Dict]:
+        """address -> history sync cursor of every wallet of a coin"""
+        db = DataBase(DB_NAME)
+        rows = db.query("SELECT address, cursor_data FROM wallet_cursors WHERE coin='%s'" % coin)
+        return {row[0]: json.loads(row[1]) for row in rows or []}
+
+    def set_wallet_cursor(self, coin, address, cursor):
+        db = DataBase(DB_NAME)
+        sql = "INSERT INTO wallet_cursors (coin, address, cursor_data) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE cursor_data=VALUES(cursor_data)"
+        db.execute(sql, (coin, address, json.dumps(cursor)))
+
+    def set_chain_cursor(self, chain, block, blockhash):
+        db = DataBase(DB_NAME)
+        sql = "INSERT INTO chain_cursors (chain, block, hash) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE block=VALUES(block), hash=VALUES(hash)"
+        db.execute(sql, (chain, block, blockhash))
+
     def to_wallet(self, walletdata) -> Optional[Wallet]:
         miner_fee = self.get_miner_fee()
         wallet = Wallet(
@@ -617,14 +676,18 @@ class MySqlStorage:
             ))
         return allwallets
 
-    def update_wallet_balance(self, wallet: FullWallet, walletbalance, hasheslist):
+    def update_wallet_balance(self, wallet: FullWallet, walletbalance, hasheslist, transactions=None):
         txhashes = hasheslist
-        transactions = blockchain.get_transactions(wallet)
+        if transactions is None:
+          transactions = blockchain.get_transactions(wallet)
         #print(transactions)
         for tx in transactions:
           if tx['hash'] not in txhashes:
-            txhashes.append(tx['hash'])
+            txhashes.add(tx['hash'])
             db = DataBase(DB_NAME)
+            if not self.claim_tx_hash(db, wallet, tx):
+              print("hash already credited " + tx['hash'])
+              continue
             if tx['side'] == 'Deposit':
               minerfees = self.get_miner_fee()
               minerfee = minerfees[wallet.coin]
@@ -645,6 +708,8 @@ class MySqlStorage:
                     wallet.email, wallet.coin, (COIN_FORMATS[wallet.coin]['format'] % (float(minerfee))), tx['hash']
               )
               success, account_id = db.execute(sql, return_id=True)
+              self.notify_transaction(wallet.email, wallet.coin, tx['side'], deposittocoinamount, txhash=tx['hash'])
+              self.notify_wallet(wallet.email, wallet.coin)
             else:
               deposittocoinamount = COIN_FORMATS[wallet.coin]['format'] % (int(float(tx['amount']))/COIN_FORMATS[wallet.coin]['decimals'])
               sql = "INSERT INTO transactions (email, coin, side, amount, price, status, txhash, txtype) VALUES ('%s','%s','%s','%s','0','completed', '%s', 'system')" % (
@@ -846,6 +911,10 @@ class MySqlStorage:
                 user.email,insert_trade.type,from_asset,to_asset, from_amount,to_amount,insert_trade.rate
           )
           success, account_id = db.execute(sql, return_id=True)
+          self.notify_transaction(user.email, from_asset, 'sell', '-' + str(from_amount))
+          self.notify_transaction(user.email, to_asset, 'buy', to_amount)
+          self.notify_wallet(user.email, from_asset)
+          self.notify_wallet(user.email, to_asset)
           
           try:
             client = self.get_valr()
@@ -946,6 +1015,8 @@ class MySqlStorage:
               user.email, send_data.fromAsset, ('-' + str(send_data.amount))
         )
         success, account_id = db.execute(sql, return_id=True)
+        self.notify_transaction(user.email, send_data.fromAsset, 'Send To', '-' + str(send_data.amount))
+        self.notify_wallet(user.email, send_data.fromAsset)
         client = self.get_valr()
 
         formatedamount =  COIN_FORMATS[wallet.coin]['format'] % (float(send_data.amount))
@@ -1048,6 +1119,8 @@ class MySqlStorage:
                   user.email,('-' + str(send_data.amount))
             )
             success, account_id = db.execute(sql, return_id=True)
+            self.notify_transaction(user.email, 'ZAR', 'Withdraw', '-' + str(send_data.amount))
+            self.notify_wallet(user.email, 'ZAR')
             # move zar from account to primary
             client = self.get_valr()
             formatedamount = "%.2f" % (int(float(send_data.amount)*100)/100)
@@ -1063,22 +1136,110 @@ class MySqlStorage:
                   user.email,('-' + str(send_data.amount))
             )
             success, account_id = db.execute(sql, return_id=True)
+            self.notify_transaction(user.email, 'ZAR', 'Withdraw', '-' + str(send_data.amount), status='failed')
             return False
           
 
-    def get_market_data(self, pair: str, timeframe: str, charttype: str) -> List[OhlcvMarketData]:
-        if charttype == 'OHLCV':
-          timedata = self.ohlcv_market_data.get(timeframe, None)
-          if timedata:
-            return timedata.get(pair, [])
-          else:
-            return []
+    def get_market_response(self, pair: str, timeframe: str, charttype: str, limit: Optional[int] = None,
+                            start: Optional[int] = None, end: Optional[int] = None,
+                            max_points: Optional[int] = None, method: str = 'lttb') -> EncodedResponse:
+        """Encoded /api/market/{pair} payload, rebuilt only when the series version changes.
+
+        Without start/end the newest `limit` points are served; a time range
+        is sliced by binary search and downsampled to max_points.
+        """
+        series = self.resampler.get(timeframe, pair)
+        limit = min(limit, self.max_chart_points) if limit and limit > 0 else self.chart_points
+        max_points = min(max_points, self.max_chart_points) if max_points and max_points > 0 else self.max_chart_points
+        charttype = 'OHLCV' if charttype == 'OHLCV' else 'line'
+        method = method if method in DOWNSAMPLE_METHODS else 'lttb'
+        if start is not None or end is not None:
+          start, end = self.chart_range(timeframe, pair, start, end)
+          # a time range ignores limit, keep it out of the key
+          limit = 0
+        key = ('market', pair, timeframe, charttype, limit, start, end, max_points, method)
+        if series is None:
+          return self.responses.get(key, None, lambda: "[]")
+        return self.responses.get(key, series.version, lambda: self.market_json(
+            series, timeframe, charttype, limit, start, end, max_points, method))
+
+    def chart_range(self, timeframe: str, pair: str, start: Optional[int], end: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+        """from/to snapped to the candle buckets they select, so equal ranges share a cache entry"""
+        base_timeframe = TIMEFRAMES[timeframe][0]
+        step = TIMEFRAME_SECONDS[base_timeframe]
+        if start is not None:
+          start = -(-int(start) // step) * step
+        if end is not None:
+          end = int(end) // step * step
+          last = self.series.last(base_timeframe, pair)
+          if last is not None and end >= last['timestamp']:
+            end = None
+        return start, end
+
+    def market_json(self, series, timeframe: str, charttype: str, limit: int, start: Optional[int],
+                    end: Optional[int], max_points: int, method: str) -> bytes:
+        if start is None and end is None:
+          data = series.data[-limit:]
         else:
-          timedata = self.market_data.get(timeframe, None)
-          if timedata:
-            return timedata.get(pair, [])
+          data = self.resampler.range(timeframe, series.pair, start, end)
+        if len(data) > max_points:
+          if charttype == 'OHLCV':
+            data = downsample_candles(data, max_points)
           else:
-            return []
+            data = downsample_line(data, max_points, method)
+        return dumps(candle_rows(series.pair, data, charttype))
+
+    def get_indicators_response(self, pair: str, timeframe: str, indicators, limit: Optional[int] = None) -> EncodedResponse:
+        """Encoded /api/market/{pair}/indicators payload for parsed (name, params) pairs"""
+        series = self.resampler.get(timeframe, pair)
+        limit = min(limit, self.max_chart_points) if limit and limit > 0 else self.chart_points
+        key = ('indicators', pair, timeframe, ','.join(indicator_key(name, params) for name, params in indicators), limit)
+        if series is None:
+          return self.responses.get(key, None, lambda: dumps({"pair": pair, "timeframe": timeframe, "timestamps": [], "indicators": {}}))
+        return self.responses.get(key, series.version, lambda: dumps(self.indicators.build(series, indicators, limit)))
+
+    def timeframe_step(self, timeframe: str) -> Optional[int]:
+        """Bucket length in seconds, None for calendar months"""
+        base_timeframe, rule = TIMEFRAMES[timeframe]
+        if rule is None:
+          return TIMEFRAME_SECONDS[base_timeframe]
+        if rule == 'week':
+          return 7 * 86400
+        return rule if isinstance(rule, int) else None
+
+    def sparkline_timeframes(self) -> List[str]:
+        return [timeframe for timeframe in TIMEFRAMES if self.timeframe_step(timeframe)]
+
+    def get_sparklines_response(self, timeframe: str) -> EncodedResponse:
+        """Encoded /api/market/sparklines payload, rebuilt once per update_latest_prices"""
+        return self.responses.get(('sparklines', timeframe), self.latest_prices_version,
+                                  lambda: dumps(self.build_sparklines(timeframe)))
+
+    def build_sparklines(self, timeframe: str) -> Dict:
+        """Every active pair as parallel arrays: grid start and base64 float32 closes"""
+        step = self.timeframe_step(timeframe)
+        pairs, starts, closes = [], [], []
+        for pair in self.activepairs:
+          series = self.resampler.get(timeframe, pair)
+          data = series.data[-self.sparkline_points:] if series is not None else []
+          start, values = sparkline(data, step, self.sparkline_points)
+          pairs.append(pair)
+          starts.append(start)
+          closes.append(base64.b64encode(values.astype('<f4').tobytes()).decode('ascii'))
+        return {
+          "timeframe": timeframe,
+          "step": step,
+          "points": self.sparkline_points,
+          "encoding": "float32-le-base64",
+          "pairs": pairs,
+          "start": starts,
+          "closes": closes,
+        }
+
+    def get_all_market_response(self) -> EncodedResponse:
+        """Encoded /api/market payload, rebuilt once per update_latest_prices"""
+        latest_prices = self.latest_prices
+        return self.responses.get(('market',), self.latest_prices_version, lambda: dump_models(latest_prices))
 
 
 
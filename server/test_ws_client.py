@@ -0,0 +1,50 @@
+"""WebSocketClient.run against a local websockets server.
+
+    pip install websockets pytest && python -m pytest server/test_ws_client.py
+"""
+import asyncio
+import json
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from websockets.asyncio.server import serve
+
+from valr_python.enum import WebSocketType
+from valr_python.ws_client import WebSocketClient
+
+TRADE = {
+    "type": "NEW_TRADE",
+    "currencyPairSymbol": "BTCZAR",
+    "data": {"price": "1000000", "quantity": "0.01", "currencyPair": "BTCZAR", "takerSide": "buy"},
+}
+
+
+def test_run_connects_subscribes_and_dispatches():
+    received = []
+    seen = {}
+
+    async def handler(connection):
+        seen['path'] = connection.request.path
+        seen['headers'] = connection.request.headers
+        seen['subscribe'] = json.loads(await connection.recv())
+        await connection.send(json.dumps({"type": "AUTHENTICATED"}))
+        await connection.send(json.dumps({"type": "SUBSCRIBED"}))
+        await connection.send(json.dumps(TRADE))
+
+    async def main():
+        async with serve(handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            client = WebSocketClient(api_key='key', api_secret='secret', hooks={'NEW_TRADE': received.append},
+                                     currency_pairs=['BTCZAR'], trade_subscriptions=['NEW_TRADE'])
+            client._uri = 'ws://127.0.0.1:%i%s' % (port, WebSocketType.TRADE.value)
+            # returns once the server closes the connection
+            await asyncio.wait_for(client.run(), 10)
+
+    asyncio.run(main())
+    assert seen['path'] == WebSocketType.TRADE.value
+    assert seen['headers']['X-VALR-API-KEY'] == 'key'
+    assert seen['headers']['X-VALR-SIGNATURE'] and seen['headers']['X-VALR-TIMESTAMP']
+    assert seen['subscribe'] == {"type": "SUBSCRIBE", "subscriptions": [{"event": "NEW_TRADE", "pairs": ["BTCZAR"]}]}
+    assert received == [TRADE]
@@ -0,0 +1,117 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import base58
+import requests
+
+from evm_follower import Deposit, TRANSFER_TOPIC
+
+TIMEOUT = 30
+# getblockbylimitnext returns at most 100 blocks per call
+MAX_BLOCKS = 100
+
+
+def http_post(session: requests.Session, api_url: str, headers: Optional[Dict] = None) -> Callable[[str, Dict], Dict]:
+    """post(path, payload) against a Tron full-node HTTP API"""
+    def post(path: str, payload: Dict) -> Dict:
+        response = session.post(api_url.rstrip('/') + path, json=payload, headers=headers, timeout=TIMEOUT)
+        response.raise_for_status()
+        reply = response.json()
+        if isinstance(reply, dict) and reply.get('Error'):
+            raise ValueError(reply['Error'])
+        return reply
+    return post
+
+
+def hex_to_base58(address: str) -> str:
+    """Base58check of a 20 byte hex address as found in event logs"""
+    return base58.b58encode_check(bytes.fromhex('41' + address[-40:])).decode()
+
+
+class TronBlockFollower:
+    """Reads each new solidified Tron block once and matches it against our addresses.
+
+    Blocks come from /walletsolidity/getblockbylimitnext, up to 100 per
+    call; native transfers are the successful TransferContract
+    transactions in them. TRC20 transfers come from the Transfer event logs
+    of /walletsolidity/gettransactioninfobyblocknum, called only for blocks
+    containing a call to one of our token contracts. Solidified blocks are
+    final, so there is nothing to rewind and `reorgs` stays 0.
+
+    `load_cursor()` returns (block, hash) or None and `save_cursor(block,
+    hash)` persists it; without a cursor following starts at the current
+    solidified head. As with EvmBlockFollower, poll() returns the cursor
+    for the caller to save once the deposits are credited. `tokens` maps
+    contract -> token coin on `network`.
+    Addresses are base58; they are compared lower case like the EVM
+    follower's, as the index built by address_index() is.
+    """
+
+    def __init__(self, coin: str, post: Callable, load_cursor: Callable, save_cursor: Callable,
+                 network: Optional[str] = None, tokens: Optional[Dict[str, str]] = None,
+                 max_blocks: int = MAX_BLOCKS):
+        self.coin = coin
+        self.network = network
+        self.post = post
+        self.load_cursor = load_cursor
+        self.save_cursor = save_cursor
+        self.tokens = dict(tokens or {})
+        self.max_blocks = min(max_blocks, MAX_BLOCKS)
+        self.reorgs = 0
+
+    def poll(self, addresses: Set[str], holders: Set[str]) -> Tuple[List[Deposit], Optional[Tuple[int, str]]]:
+        """(deposits in the next range of solidified blocks, cursor to save after them)
+
+        addresses are our TRX deposit addresses, holders our TRC20 holder
+        addresses, both lower case. The cursor is None when there is
+        nothing new.
+        """
+        head = self.post("/walletsolidity/getnowblock", {})
+        target = head['block_header']['raw_data']['number']
+        cursor = self.load_cursor()
+        if cursor is None:
+            return [], (target, head['blockID'])
+        last, _ = cursor
+        start = last + 1
+        end = min(target, last + self.max_blocks)
+        if end < start:
+            return [], None
+        reply = self.post("/walletsolidity/getblockbylimitnext", {"startNum": start, "endNum": end + 1, "visible": True})
+        blocks = sorted(reply.get('block', []), key=lambda block: block['block_header']['raw_data']['number'])
+        if [block['block_header']['raw_data']['number'] for block in blocks] != list(range(start, end + 1)):
+            raise ValueError("%s blocks %i-%i unavailable" % (self.coin, start, end))
+        contracts = set(self.tokens)
+        deposits = []
+        for block in blocks:
+            number = block['block_header']['raw_data']['number']
+            calls_token = False
+            for tx in block.get('transactions', []):
+                if tx.get('ret', [{}])[0].get('contractRet', 'SUCCESS') != 'SUCCESS':
+                    continue
+                for contract in tx['raw_data'].get('contract', []):
+                    value = contract['parameter']['value']
+                    if contract['type'] == 'TransferContract':
+                        to = value.get('to_address', '').lower()
+                        if value.get('amount') and to in addresses:
+                            deposits.append(Deposit(self.coin, to, tx['txID'], int(value['amount']), number))
+                    elif contract['type'] == 'TriggerSmartContract' and value.get('contract_address') in contracts:
+                        calls_token = True
+            if calls_token and holders:
+                deposits += self.token_transfers(number, holders)
+        return deposits, (end, blocks[-1]['blockID'])
+
+    def token_transfers(self, number: int, holders: Set[str]) -> List[Deposit]:
+        infos = self.post("/walletsolidity/gettransactioninfobyblocknum", {"num": number})
+        deposits = []
+        for info in infos or []:
+            if info.get('receipt', {}).get('result', 'SUCCESS') != 'SUCCESS':
+                continue
+            for log in info.get('log', []):
+                topics = log.get('topics', [])
+                if len(topics) < 3 or topics[0] != TRANSFER_TOPIC[2:]:
+                    continue
+                token = self.tokens.get(hex_to_base58(log['address']))
+                to = hex_to_base58(topics[2]).lower()
+                if token is None or to not in holders:
+                    continue
+                deposits.append(Deposit(token, to, info['id'], int(log.get('data') or '0', 16), number))
+        return deposits
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+TX_CACHE_PATH = os.environ.get('TX_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'txcache.sqlite'))
+MAX_ENTRIES = 50000
+
+MISSING = object()
+
+
+class TxCache:
+    """Cache of confirmed transactions keyed by txid, an LRU over sqlite.
+
+    Holds the raw bytes of a transaction (per chain) and what we decoded
+    from it for one of our addresses: the {hash, side, amount} dict, or
+    None when the transaction does not concern the address. Only put
+    confirmed transactions here; nothing is ever invalidated.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory: OrderedDict = OrderedDict()
+        self.db = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS raw (chain TEXT, txid TEXT, data BLOB, PRIMARY KEY (chain, txid))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS decoded (chain TEXT, txid TEXT, address TEXT, data TEXT, PRIMARY KEY (chain, txid, address))")
+        return self.db
+
+    def remember(self, key: Tuple, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_raw_many(self, chain: str, txids: Iterable[str]) -> Dict[str, bytes]:
+        """Raw transactions found for txids, from memory first, then one query"""
+        found = {}
+        missing = []
+        txids = list(txids)
+        with self.lock:
+            for txid in txids:
+                value = self.memory.get(('raw', chain, txid), MISSING)
+                if value is MISSING:
+                    missing.append(txid)
+                else:
+                    self.memory.move_to_end(('raw', chain, txid))
+                    found[txid] = value
+            for offset in range(0, len(missing), 500):
+                chunk = missing[offset:offset + 500]
+                rows = self.connect().execute(
+                    "SELECT txid, data FROM raw WHERE chain=? AND txid IN (%s)" % ','.join('?' * len(chunk)),
+                    [chain] + chunk).fetchall()
+                for txid, data in rows:
+                    found[txid] = bytes(data)
+                    self.remember(('raw', chain, txid), bytes(data))
+            self.hits += len(found)
+            self.misses += len(txids) - len(found)
+        return found
+
+    def put_raw(self, chain: str, txid: str, data: bytes):
+        with self.lock:
+            self.remember(('raw', chain, txid), data)
+            self.connect().execute("INSERT OR IGNORE INTO raw VALUES (?, ?, ?)", (chain, txid, data))
+            self.db.commit()
+
+    def get_decoded(self, chain: str, txid: str, address: str):
+        """Decoded result, None for an irrelevant transaction, or MISSING"""
+        key = ('decoded', chain, txid, address)
+        with self.lock:
+            value = self.memory.get(key, MISSING)
+            if value is MISSING:
+                row = self.connect().execute(
+                    "SELECT data FROM decoded WHERE chain=? AND txid=? AND address=?", (chain, txid, address)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return MISSING
+                value = json.loads(row[0])
+                self.remember(key, value)
+            else:
+                self.memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put_decoded(self, chain: str, txid: str, address: str, value: Optional[Dict]):
+        with self.lock:
+            self.remember(('decoded', chain, txid, address), value)
+            self.connect().execute("INSERT OR REPLACE INTO decoded VALUES (?, ?, ?, ?)", (chain, txid, address, json.dumps(value)))
+            self.db.commit()
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.memory), "hits": self.hits, "misses": self.misses}
+
+
+tx_cache = TxCache(TX_CACHE_PATH)
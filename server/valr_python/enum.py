@@ -131,3 +131,6 @@ class CurrencyPair(NameStrEnum):
     ETHZAR = auto()
     XRPZAR = auto()
     SOLZAR = auto()
+    USDTZAR = auto()
+    BNBZAR = auto()
+    TRXZAR = auto()
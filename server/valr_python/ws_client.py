@@ -912,7 +912,8 @@ class WebSocketClient:
         """
         headers = _get_valr_headers(api_key=self._api_key, api_secret=self._api_secret, method='GET',
                                     path=self._ws_type.value, data='')
-        async with websockets.connect(self._uri, ssl=True, extra_headers=headers) as ws:
+        # wss:// implies TLS; websockets >= 14 takes the handshake headers as additional_headers
+        async with websockets.connect(self._uri, additional_headers=headers) as ws:
             if self._ws_type == WebSocketType.TRADE:
                 await ws.send(self.get_subscribe_data(self._currency_pairs, self._trade_subscriptions))
             async for message in ws:
@@ -0,0 +1,127 @@
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+MAX_QUEUE = 256
+STALL_TIMEOUT = 30.0
+
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+
+
+class FanoutMetrics:
+    """Counters shared by every connection, exposed on /api/ws/metrics"""
+
+    def __init__(self):
+        self.connections = 0
+        self.connections_total = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.stalled = 0
+        self.overflowed = 0
+
+    def as_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+class SendQueue:
+    """Bounded outgoing queue of one websocket with a single write in flight.
+
+    `write(message)` must return the transport's Future (Tornado's
+    write_message does); the next message is only written once it resolves,
+    so a slow client backs up here instead of in the stream buffer. When
+    the queue is full, with COALESCE all pending messages of the topic
+    collapse into one lazy snapshot which also absorbs later deltas until
+    it is sent; otherwise the oldest topic message is dropped. Messages
+    without a key (private events, replies) are never dropped: if one
+    does not fit, the queue closes and calls `on_overflow()`.
+    """
+
+    def __init__(self, write: Callable, metrics: FanoutMetrics, policy: str = COALESCE, max_size: int = MAX_QUEUE,
+                 on_overflow: Optional[Callable] = None):
+        self.write = write
+        self.metrics = metrics
+        self.on_overflow = on_overflow
+        self.policy = policy
+        self.max_size = max_size
+        self.queue = deque()
+        self.snapshots = set()
+        self.pending = None
+        self.pending_since = 0.0
+        self.closed = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, message: bytes, key: Optional[str] = None, snapshot: Optional[Callable] = None):
+        if self.closed:
+            return
+        if key is not None and key in self.snapshots:
+            # a queued snapshot of this topic will carry the change
+            self.metrics.coalesced += 1
+            return
+        if len(self.queue) >= self.max_size:
+            if self.policy == COALESCE and key is not None and snapshot is not None:
+                self.queue = deque(entry for entry in self.queue if entry[0] != key)
+                message = snapshot
+                self.metrics.coalesced += 1
+            if len(self.queue) >= self.max_size and not self.drop_oldest_topic():
+                if key is not None:
+                    self.metrics.dropped += 1
+                    return
+                # only undroppable messages queued: the client cannot keep up
+                self.metrics.overflowed += 1
+                self.close()
+                if self.on_overflow is not None:
+                    self.on_overflow()
+                return
+        if callable(message):
+            self.snapshots.add(key)
+        self.queue.append((key, message))
+        self.drain()
+
+    def drop_oldest_topic(self) -> bool:
+        """Drop the oldest queued topic message, False when there is none"""
+        for index, (key, message) in enumerate(self.queue):
+            if key is not None:
+                del self.queue[index]
+                if callable(message):
+                    self.snapshots.discard(key)
+                self.metrics.dropped += 1
+                return True
+        return False
+
+    def drain(self):
+        while self.queue and self.pending is None and not self.closed:
+            key, message = self.queue.popleft()
+            if callable(message):
+                self.snapshots.discard(key)
+                message = message()
+            try:
+                future = self.write(message)
+            except Exception:
+                self.close()
+                return
+            self.metrics.sent += 1
+            if future is not None and not future.done():
+                self.pending = future
+                self.pending_since = time.monotonic()
+                future.add_done_callback(self._written)
+
+    def _written(self, future):
+        self.pending = None
+        if future.cancelled() or future.exception() is not None:
+            self.close()
+            return
+        self.drain()
+
+    def stalled(self, now: Optional[float] = None) -> bool:
+        """True when one write has been waiting on the client for too long"""
+        now = time.monotonic() if now is None else now
+        return self.pending is not None and now - self.pending_since > STALL_TIMEOUT
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self.snapshots.clear()
@@ -0,0 +1,113 @@
+from typing import Callable, Dict, Optional, Set
+
+from serializer import dumps
+
+
+def topic_name(channel: str, pair: str) -> str:
+    """('candles:1H', 'BTC/ZAR') -> 'candles:1H:BTC/ZAR'"""
+    return "%s:%s" % (channel, pair)
+
+
+def split_topic(name: str):
+    """'candles:1H:BTC/ZAR' -> ('candles:1H', 'BTC/ZAR')"""
+    channel, _, pair = name.rpartition(':')
+    return channel, pair
+
+
+class Topic:
+    """Latest state of one (channel, pair) stream and its subscribers.
+
+    Every accepted update bumps `seq` and only the fields that changed are
+    sent; a client that sees a gap in seq asks for a fresh snapshot.
+    """
+
+    def __init__(self, name: str, state: Optional[Dict] = None):
+        self.name = name
+        self.seq = 0
+        self.state: Dict = dict(state or {})
+        self.subscribers: Set = set()
+        self.encoded = (-1, b'')
+
+    def snapshot(self) -> bytes:
+        """Encoded once per seq and shared by every subscriber"""
+        seq, message = self.encoded
+        if seq != self.seq:
+            message = dumps({"type": "snapshot", "topic": self.name, "seq": self.seq, "data": self.state})
+            self.encoded = (self.seq, message)
+        return message
+
+    def update(self, state: Dict) -> Optional[bytes]:
+        """Apply a full state, returning the encoded delta or None if nothing changed"""
+        delta = {key: value for key, value in state.items() if self.state.get(key) != value}
+        if not delta:
+            return None
+        self.state.update(delta)
+        self.seq += 1
+        return dumps({"type": "delta", "topic": self.name, "seq": self.seq, "data": delta})
+
+
+class TopicRegistry:
+    """Topics keyed by name with per-connection subscriptions.
+
+    Connections only need a send(message: bytes, topic=None) method.
+    `providers` maps a channel prefix ('ticker', 'candles', 'orderbook') to
+    a callable (channel, pair) -> state used to seed a topic on first
+    subscription.
+    Not thread-safe: call it from the IOLoop thread only.
+    """
+
+    def __init__(self, providers: Dict[str, Callable]):
+        self.providers = providers
+        self.topics: Dict[str, Topic] = {}
+        self.subscriptions: Dict[object, Set[str]] = {}
+
+    def valid(self, name: str) -> bool:
+        channel, pair = split_topic(name)
+        return bool(pair) and channel.split(':')[0] in self.providers
+
+    def topic(self, name: str) -> Topic:
+        topic = self.topics.get(name)
+        if topic is None:
+            channel, pair = split_topic(name)
+            state = self.providers[channel.split(':')[0]](channel, pair)
+            topic = self.topics[name] = Topic(name, state)
+        return topic
+
+    def has_subscribers(self, name: str) -> bool:
+        topic = self.topics.get(name)
+        return topic is not None and bool(topic.subscribers)
+
+    def subscribe(self, conn, name: str):
+        topic = self.topic(name)
+        topic.subscribers.add(conn)
+        self.subscriptions.setdefault(conn, set()).add(name)
+        conn.send(topic.snapshot(), topic)
+
+    def resync(self, conn, name: str):
+        topic = self.topics.get(name)
+        if topic is not None and conn in topic.subscribers:
+            conn.send(topic.snapshot(), topic)
+
+    def unsubscribe(self, conn, name: str):
+        topic = self.topics.get(name)
+        if topic is not None:
+            topic.subscribers.discard(conn)
+        self.subscriptions.get(conn, set()).discard(name)
+
+    def remove(self, conn):
+        for name in self.subscriptions.pop(conn, set()):
+            topic = self.topics.get(name)
+            if topic is not None:
+                topic.subscribers.discard(conn)
+
+    def publish(self, name: str, state: Dict):
+        """Update a topic and send the delta to its subscribers only"""
+        topic = self.topics.get(name)
+        if topic is None:
+            # nobody ever asked for it; it is seeded on first subscription
+            return
+        message = topic.update(state)
+        if message is None:
+            return
+        for conn in list(topic.subscribers):
+            conn.send(message, topic)